@@ -1,19 +1,41 @@
+from collections import defaultdict
+
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.utils.html import format_html
-from .models import Category, Product, ProductImage, Customer, Order, OrderItem
+from .inventory import stock_shortages
+from .models import Category, Product, ProductImage, Customer, Order, OrderItem, DailySalesRollup
+from .search import get_search_backend, query_terms
+from .tracking import counted_sales, order_written, snapshot_order, sold_units
+
+
+class ImagePreviewMixin:
+    def image_preview(self, obj):
+        # The thumbnail rendition once it exists, originals are often megabytes
+        path = obj.renditions.get('thumbnail', {}).get('jpeg')
+        if path:
+            return format_html('<img src="{}" width="100" height="auto" />', default_storage.url(path))
+        if obj.image:
+            return format_html('<img src="{}" width="100" height="auto" loading="lazy" />', obj.image.url)
+        return "No Image"
+
+    image_preview.short_description = 'Image Preview'
 
 
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ImagePreviewMixin, admin.ModelAdmin):
     list_display = ('name', 'parent', 'description', 'created_at', 'updated_at')
+    list_select_related = ('parent',)
     list_filter = ('created_at', 'updated_at')
     search_fields = ('name', 'description')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'image_preview')
     fieldsets = (
         (None, {
             'fields': ('name', 'description', 'parent')
         }),
         ('Media', {
-            'fields': ('image',)
+            'fields': ('image', 'image_preview')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -22,17 +44,19 @@ class CategoryAdmin(admin.ModelAdmin):
     )
 
 
-class ProductImageInline(admin.TabularInline):
+class ProductImageInline(ImagePreviewMixin, admin.TabularInline):
     model = ProductImage
     extra = 1
-    fields = ('image', 'is_primary')
+    fields = ('image', 'image_preview', 'is_primary')
+    readonly_fields = ('image_preview',)
 
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'discount_price', 'category', 'stock', 'is_active', 'created_at')
+    list_select_related = ('category',)
     list_filter = ('is_active', 'category', 'created_at')
     search_fields = ('name', 'description')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('units_sold', 'revenue', 'created_at', 'updated_at')
     inlines = [ProductImageInline]
     fieldsets = (
         (None, {
@@ -41,29 +65,32 @@ class ProductAdmin(admin.ModelAdmin):
         ('Pricing and Inventory', {
             'fields': ('price', 'discount_price', 'stock', 'is_active')
         }),
+        ('Sales', {
+            'fields': ('units_sold', 'revenue')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        if not query_terms(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(get_search_backend().matching(search_term)), False
+
 
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(ImagePreviewMixin, admin.ModelAdmin):
     list_display = ('id', 'product', 'image_preview', 'is_primary', 'created_at')
+    list_select_related = ('product',)
     list_filter = ('is_primary', 'created_at')
     search_fields = ('product__name',)
-    readonly_fields = ('created_at', 'image_preview')
-
-    def image_preview(self, obj):
-        if obj.image:
-            return format_html('<img src="{}" width="100" height="auto" />', obj.image.url)
-        return "No Image"
-
-    image_preview.short_description = 'Image Preview'
+    readonly_fields = ('created_at', 'image_preview', 'image_hash')
 
 
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone', 'address', 'created_at', 'updated_at')
+    list_select_related = ('user',)
     list_filter = ('created_at', 'updated_at')
     search_fields = ('user__username', 'user__email', 'phone', 'address')
     readonly_fields = ('created_at', 'updated_at')
@@ -78,8 +105,46 @@ class CustomerAdmin(admin.ModelAdmin):
     )
 
 
+def reserved_units(order):
+    """Units per product the saved ``order`` currently holds in stock."""
+    before = snapshot_order(order)
+    return sold_units(counted_sales(before['status'], before['sales'])) if before else {}
+
+
+def check_stock(before, after):
+    """
+    Raise a ValidationError naming every product that is short for moving
+    from the ``before`` to the ``after`` reservations, as order_written would
+    raise InsufficientStock after the admin already saved the order.
+    """
+    shortages = stock_shortages(before, after)
+    if shortages:
+        names = Product.objects.in_bulk([shortage['product'] for shortage in shortages])
+        raise ValidationError([
+            f"Not enough stock of {names[shortage['product']]}: "
+            f"{shortage['requested']} more requested, {shortage['available']} available."
+            for shortage in shortages
+        ])
+
+
+class OrderItemInlineFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        after = defaultdict(int)
+        # The order carries the status submitted with it, cancelled orders hold no stock
+        if self.instance.status != 'cancelled':
+            for form in self.forms:
+                data = form.cleaned_data
+                if data and not data.get('DELETE') and data.get('product'):
+                    after[data['product'].pk] += data['quantity']
+        check_stock(reserved_units(self.instance), after)
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
+    formset = OrderItemInlineFormSet
     extra = 1
     fields = ('product', 'quantity', 'price')
     raw_id_fields = ('product',)
@@ -87,6 +152,7 @@ class OrderItemInline(admin.TabularInline):
 
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'status', 'total_price', 'payment_method', 'created_at', 'updated_at')
+    list_select_related = ('customer__user',)
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('customer__user__username', 'shipping_address')
     readonly_fields = ('created_at', 'updated_at')
@@ -104,18 +170,63 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        obj._sales_snapshot = snapshot_order(obj)
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        order_written(form.instance, getattr(form.instance, '_sales_snapshot', None))
+
+
+class OrderItemAdminForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        order, product, quantity = (cleaned_data.get(name) for name in ('order', 'product', 'quantity'))
+        if order is None or product is None or quantity is None or order.status == 'cancelled':
+            return cleaned_data
+        before = reserved_units(order)
+        after = defaultdict(int, before)
+        if self.instance.pk and self.instance.order_id == order.pk:
+            # The instance still holds the saved item until the form is saved
+            after[self.instance.product_id] -= self.instance.quantity
+        after[product.pk] += quantity
+        check_stock(before, after)
+        return cleaned_data
+
 
 class OrderItemAdmin(admin.ModelAdmin):
+    form = OrderItemAdminForm
     list_display = ('id', 'order', 'product', 'quantity', 'price', 'created_at')
+    list_select_related = ('order__customer__user', 'product')
     list_filter = ('created_at',)
     search_fields = ('order__id', 'product__name')
     readonly_fields = ('created_at',)
     raw_id_fields = ('order', 'product')
 
+    def save_model(self, request, obj, form, change):
+        before = snapshot_order(obj.order)
+        super().save_model(request, obj, form, change)
+        order_written(obj.order, before)
+
+    def delete_model(self, request, obj):
+        before = snapshot_order(obj.order)
+        super().delete_model(request, obj)
+        order_written(obj.order, before)
+
+
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'product', 'status', 'units', 'revenue', 'order_count')
+    list_select_related = ('product',)
+    list_filter = ('status', 'day')
+    search_fields = ('product__name',)
+    raw_id_fields = ('product',)
+
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage, ProductImageAdmin)
 admin.site.register(Customer, CustomerAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(OrderItem, OrderItemAdmin)
\ No newline at end of file
+admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(DailySalesRollup, DailySalesRollupAdmin)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import heapq
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from decimal import Decimal
+from itertools import compress, islice
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import seconds_since_last_write
+from .models import Order, OrderItem
+from .rollup import rollup_day
+
+
+MAGIC = b'APISNAP1'
+HEADER_LENGTH = struct.Struct('<I')
+ALIGNMENT = 8
+CHUNK_SIZE = 2000
+
+STATUSES = [value for value, _ in Order.STATUS_CHOICES]
+
+# Columns of each fact table and their array typecodes. Days are proleptic
+# Gregorian ordinals and money is stored in cents; both tables are sorted by day.
+TABLES = {
+    'orders': {
+        'day': 'i', 'order': 'q', 'customer': 'q', 'status': 'b', 'total': 'q',
+    },
+    'items': {
+        'day': 'i', 'order': 'q', 'customer': 'q', 'product': 'q', 'status': 'b', 'quantity': 'q', 'revenue': 'q',
+    },
+}
+
+
+def to_cents(value):
+    return int(value * 100)
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def order_facts():
+    rows = (
+        Order.objects
+        .order_by('created_at', 'id')
+        .values_list('created_at', 'id', 'customer_id', 'status', 'total_price')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for created_at, order_id, customer_id, status, total_price in rows:
+        yield rollup_day(created_at).toordinal(), order_id, customer_id, STATUSES.index(status), to_cents(total_price)
+
+
+def item_facts():
+    rows = (
+        OrderItem.objects
+        .order_by('order__created_at', 'id')
+        .values_list('order__created_at', 'order_id', 'order__customer_id', 'product_id', 'order__status', 'quantity', 'price')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for created_at, order_id, customer_id, product_id, status, quantity, price in rows:
+        yield (
+            rollup_day(created_at).toordinal(), order_id, customer_id, product_id,
+            STATUSES.index(status), quantity, to_cents(price * quantity)
+        )
+
+
+def write_columns(directory, table, facts):
+    """
+    Stream ``facts`` into one file per column of ``table`` under ``directory``,
+    CHUNK_SIZE rows at a time. Returns the number of rows written.
+    """
+    typecodes = TABLES[table]
+    outputs = [open(os.path.join(directory, f'{table}.{name}'), 'wb') for name in typecodes]
+    count = 0
+    try:
+        for chunk in iter(lambda: list(islice(facts, CHUNK_SIZE)), []):
+            for typecode, output, values in zip(typecodes.values(), outputs, zip(*chunk)):
+                array(typecode, values).tofile(output)
+            count += len(chunk)
+    finally:
+        for output in outputs:
+            output.close()
+    return count
+
+
+def build_snapshot(path):
+    """
+    Export Order and OrderItem facts into columnar arrays and write them to
+    ``path``, replacing any previous snapshot atomically. Returns the number
+    of orders and items written.
+    """
+    # Writes committed after this point may be missing from the snapshot
+    started = time.time()
+    # Columns are staged next to the snapshot rather than in a temporary
+    # directory that may live in memory
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+        counts = {
+            table: write_columns(directory, table, facts)
+            for table, facts in (('orders', order_facts()), ('items', item_facts()))
+        }
+
+        header = {
+            'built_at': started,
+            'database': str(connection.settings_dict['NAME']),
+            'byteorder': sys.byteorder,
+            'rows': counts,
+            'columns': {},
+        }
+        # Column offsets depend on the header size, so lay the columns out relative
+        # to an aligned data section that starts after the header
+        offset = 0
+        for table, typecodes in TABLES.items():
+            for name, typecode in typecodes.items():
+                header['columns'][f'{table}.{name}'] = [typecode, offset, counts[table]]
+                size = counts[table] * array(typecode).itemsize
+                offset += size + (-size % ALIGNMENT)
+
+        encoded = json.dumps(header).encode('utf-8')
+        data_start = len(MAGIC) + HEADER_LENGTH.size + len(encoded)
+        data_start += -data_start % ALIGNMENT
+
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as output:
+            output.write(MAGIC)
+            output.write(HEADER_LENGTH.pack(len(encoded)))
+            output.write(encoded)
+            output.write(b'\0' * (data_start - output.tell()))
+            for column in header['columns']:
+                with open(os.path.join(directory, column), 'rb') as source:
+                    shutil.copyfileobj(source, output)
+                output.write(b'\0' * (-output.tell() % ALIGNMENT))
+    os.replace(temporary, path)
+    return counts
+
+
+class AnalyticsSnapshot:
+    """
+    Read-only view of a snapshot file. Columns are memoryviews straight over
+    the memory-mapped file, so opening a snapshot copies nothing and the
+    aggregations below run over contiguous machine integers.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as source:
+            self.mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not an analytics snapshot')
+        position = len(MAGIC)
+        (length,) = HEADER_LENGTH.unpack_from(self.mmap, position)
+        position += HEADER_LENGTH.size
+        header = json.loads(self.mmap[position:position + length])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was built on a machine with a different byte order')
+        data_start = position + length
+        data_start += -data_start % ALIGNMENT
+
+        self.built_at = header['built_at']
+        self.database = header['database']
+        self.rows = header['rows']
+        buffer = memoryview(self.mmap)
+        self.columns = {}
+        for name, (typecode, offset, count) in header['columns'].items():
+            size = array(typecode).itemsize
+            start = data_start + offset
+            self.columns[name] = buffer[start:start + count * size].cast(typecode)
+
+    def age(self):
+        return time.time() - self.built_at
+
+    def day_range(self, table, start=None, end=None):
+        """Row bounds of ``table`` for the ``start``..``end`` dates (half-open), by bisecting the day column."""
+        days = self.columns[f'{table}.day']
+        low = 0 if start is None else bisect_left(days, start.toordinal())
+        high = len(days) if end is None else bisect_left(days, end.toordinal())
+        return low, high
+
+    def status_filter(self, table, low, high, exclude_statuses):
+        """
+        Selector of the ``low``..``high`` rows of ``table`` whose status is not
+        in ``exclude_statuses``, for :func:`itertools.compress`.
+        """
+        allowed = set(range(len(STATUSES))) - {STATUSES.index(status) for status in exclude_statuses}
+        return map(allowed.__contains__, self.columns[f'{table}.status'][low:high])
+
+    def total(self, table, column, start=None, end=None):
+        low, high = self.day_range(table, start, end)
+        return sum(self.columns[f'{table}.{column}'][low:high])
+
+    def sum_by(self, table, key, column=None, start=None, end=None, exclude_statuses=()):
+        """
+        Group ``table`` rows between ``start`` and ``end`` by ``key`` and sum
+        ``column``, or count rows when ``column`` is None. Status filtering
+        and counting run in C-level iterators over the column slices, which
+        leaves one dictionary update per row for sums.
+        """
+        low, high = self.day_range(table, start, end)
+        rows = self.columns[f'{table}.{key}'][low:high]
+        if column is not None:
+            rows = zip(rows, self.columns[f'{table}.{column}'][low:high])
+        if exclude_statuses:
+            rows = compress(rows, self.status_filter(table, low, high, exclude_statuses))
+        if column is None:
+            return Counter(rows)
+
+        totals = defaultdict(int)
+        for group, value in rows:
+            totals[group] += value
+        return totals
+
+    def top(self, totals, limit):
+        """The ``limit`` largest groups of ``totals`` as (key, total) pairs, ties broken by key."""
+        return heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def fresh_snapshot():
+    """
+    Return the configured snapshot if it was built from the current database
+    within ANALYTICS_SNAPSHOT_MAX_AGE seconds and no write has bumped the
+    data version since, otherwise None. The file is mapped once per process
+    and remapped when a refresh replaces it.
+    """
+    path = settings.ANALYTICS_SNAPSHOT_PATH
+    if not path:
+        return None
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != modified:
+            try:
+                loaded = (modified, AnalyticsSnapshot(path))
+            except ValueError:
+                return None
+            # The previous mapping is left for the garbage collector, readers may still hold it
+            _loaded[path] = loaded
+        snapshot = loaded[1]
+
+    if snapshot.database != str(connection.settings_dict['NAME']):
+        return None
+    if snapshot.age() > settings.ANALYTICS_SNAPSHOT_MAX_AGE:
+        return None
+    # Dashboards are cached against the data version, figures computed from a
+    # snapshot that predates the last write would be kept under the new version
+    since_write = seconds_since_last_write()
+    if since_write is not None and since_write < snapshot.age():
+        return None
+    return snapshot
@@ -0,0 +1,75 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.views import View
+
+from .cache import async_versioned_cache
+from .dashboard import recent_orders, revenue_report, top_customers, total_orders, total_revenue
+from .models import Customer, Product
+from .tracking import top_selling_products
+
+
+def in_worker_thread(function, *args):
+    """
+    Run the sync ORM call ``function(*args)`` in a worker thread of its own.
+
+    Django's async ORM methods (``acount()``, ``aaggregate()``, ...) all run
+    on the one thread-sensitive executor, so gathering them still runs the
+    queries one after another. Worker threads each use their own database
+    connection, so queries awaited together really do run concurrently.
+    """
+    def call():
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+class AsyncDashboardStatsView(View):
+    replica_reads = True
+
+    @async_versioned_cache
+    async def get(self, request):
+        products, orders, customers, revenue, top_products, recent = await asyncio.gather(
+            in_worker_thread(Product.objects.count),
+            in_worker_thread(total_orders),
+            in_worker_thread(Customer.objects.count),
+            in_worker_thread(total_revenue),
+            in_worker_thread(top_selling_products, 3),
+            in_worker_thread(recent_orders),
+        )
+        return {
+            'total_products': products,
+            'total_orders': orders,
+            'total_customers': customers,
+            'total_revenue': str(revenue),
+            'top_products': top_products,
+            'recent_orders': recent
+        }
+
+
+class AsyncTopProductsView(View):
+    replica_reads = True
+
+    @async_versioned_cache
+    async def get(self, request):
+        return await in_worker_thread(top_selling_products, 10)
+
+
+class AsyncTopCustomersView(View):
+    replica_reads = True
+
+    @async_versioned_cache
+    async def get(self, request):
+        return await in_worker_thread(top_customers)
+
+
+class AsyncRevenueStatsView(View):
+    replica_reads = True
+    cache_per_day = True
+
+    @async_versioned_cache
+    async def get(self, request):
+        return await in_worker_thread(revenue_report, request.GET)
@@ -0,0 +1,303 @@
+import io
+import math
+import time
+import tracemalloc
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import Category, Customer, Order, OrderItem, Product, ProductImage
+
+
+class Benchmark:
+    """
+    One request to time. ``path`` and ``payload`` are callables taking the
+    fixture ids. Writes run in a transaction that is rolled back after each
+    request, with ``setup`` adding per-request fixtures inside it.
+    ``settings`` are overridden while the request runs and ``headers``, a
+    callable like ``path``, adds request headers.
+    """
+
+    def __init__(self, name, path, method='GET', payload=None, format='json', setup=None, teardown=None,
+                 iterations=None, settings=None, headers=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.payload = payload
+        self.format = format
+        self.setup = setup
+        self.teardown = teardown
+        self.iterations = iterations
+        self.settings = settings or {}
+        self.headers = headers
+
+    @property
+    def writes(self):
+        return self.method != 'GET'
+
+
+def png_upload():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(output, format='PNG')
+    return SimpleUploadedFile('benchmark.png', output.getvalue(), content_type='image/png')
+
+
+def order_payload(fixtures, products=3):
+    return {
+        'customer': fixtures['customer'],
+        'total_price': '30.00',
+        'shipping_address': '1 Main street',
+        'payment_method': 'card',
+        'items': [
+            {'product': product_id, 'quantity': 1, 'price': '10.00'}
+            for product_id in fixtures['products'][:products]
+        ]
+    }
+
+
+def create_user(fixtures):
+    return {'user': User.objects.create(username=f'benchmark{time.monotonic_ns()}').pk}
+
+
+def create_image(fixtures):
+    return {'image': ProductImage.objects.create(product_id=fixtures['product'], image='products/benchmark.png').pk}
+
+
+def current_etag(path):
+    """A ``setup`` that fetches ``path`` first and keeps its ETag, for revalidation benchmarks."""
+    def setup(fixtures):
+        return {'etag': APIClient().get(path(fixtures))['ETag']}
+    return setup
+
+
+def if_none_match(fixtures):
+    return {'If-None-Match': fixtures['etag']}
+
+
+def delete_uploaded_image(fixtures, response):
+    for image in ProductImage.objects.filter(pk=response.data.get('id')):
+        image.image.delete(save=False)
+
+
+BENCHMARKS = [
+    Benchmark('api-root', lambda f: '/api/'),
+
+    Benchmark('category-list', lambda f: '/api/categories/'),
+    Benchmark('category-list-with-stats', lambda f: '/api/categories/?with_stats=1'),
+    Benchmark('category-tree', lambda f: '/api/categories/tree/'),
+    Benchmark('category-list-not-modified', lambda f: '/api/categories/',
+              setup=current_etag(lambda f: '/api/categories/'), headers=if_none_match),
+    Benchmark('category-detail', lambda f: f"/api/categories/{f['category']}/"),
+    Benchmark('category-create', lambda f: '/api/categories/', 'POST',
+              lambda f: {'name': 'Benchmark', 'parent': f['category']}),
+
+    Benchmark('product-list', lambda f: '/api/products/'),
+    Benchmark('product-list-lean', lambda f: '/api/products/?lean=true'),
+    Benchmark('product-list-sparse', lambda f: '/api/products/?fields=id,name,price'),
+    Benchmark('product-list-100', lambda f: '/api/products/?page_size=100'),
+    Benchmark('product-list-100-serializer', lambda f: '/api/products/?page_size=100',
+              settings={'FAST_LIST_SERIALIZATION': False}),
+    Benchmark('product-list-not-modified', lambda f: '/api/products/?page_size=100',
+              setup=current_etag(lambda f: '/api/products/?page_size=100'), headers=if_none_match),
+    Benchmark('product-list-filtered', lambda f: (
+        f"/api/products/?category={f['root_category']}&include_descendants=true"
+        '&in_stock=true&ordering=-price&facets=true'
+    )),
+    Benchmark('product-search', lambda f: f"/api/products/search/?q={f['search_term']}"),
+    Benchmark('product-detail', lambda f: f"/api/products/{f['product']}/"),
+    Benchmark('product-detail-not-modified', lambda f: f"/api/products/{f['product']}/",
+              setup=current_etag(lambda f: f"/api/products/{f['product']}/"), headers=if_none_match),
+    Benchmark('product-create', lambda f: '/api/products/', 'POST', lambda f: {
+        'name': 'Benchmark product', 'description': 'Benchmark', 'price': '10.00',
+        'category': f['category'], 'stock': 10, 'images': []
+    }),
+    Benchmark('product-update', lambda f: f"/api/products/{f['product']}/", 'PATCH',
+              lambda f: {'stock': 500}),
+    Benchmark('product-images', lambda f: f"/api/products/{f['product']}/images/", 'POST',
+              lambda f: {'image': png_upload(), 'is_primary': False}, format='multipart',
+              teardown=delete_uploaded_image),
+    Benchmark('product-delete-image', lambda f: f"/api/products/{f['product']}/images/{f['image']}/", 'DELETE',
+              setup=create_image),
+
+    Benchmark('customer-list', lambda f: '/api/customers/'),
+    Benchmark('customer-detail', lambda f: f"/api/customers/{f['customer']}/"),
+    Benchmark('customer-orders', lambda f: f"/api/customers/{f['customer']}/orders/"),
+    Benchmark('customer-create', lambda f: '/api/customers/', 'POST',
+              lambda f: {'user': f['user'], 'phone': '+15550000000'}, setup=create_user),
+
+    Benchmark('order-list', lambda f: '/api/orders/'),
+    Benchmark('order-list-sparse', lambda f: '/api/orders/?fields=id,status,total_price'),
+    Benchmark('order-list-100', lambda f: '/api/orders/?page_size=100'),
+    Benchmark('order-list-100-serializer', lambda f: '/api/orders/?page_size=100',
+              settings={'FAST_LIST_SERIALIZATION': False}),
+    Benchmark('order-detail', lambda f: f"/api/orders/{f['order']}/"),
+    Benchmark('order-create', lambda f: '/api/orders/', 'POST', order_payload),
+    Benchmark('order-bulk', lambda f: '/api/orders/bulk/', 'POST',
+              lambda f: [order_payload(f) for _ in range(50)]),
+    Benchmark('order-update-status', lambda f: f"/api/orders/{f['order']}/status/", 'PATCH',
+              lambda f: {'status': 'cancelled'}),
+    Benchmark('order-delete', lambda f: f"/api/orders/{f['order']}/", 'DELETE'),
+
+    Benchmark('dashboard-stats', lambda f: '/api/dashboard/stats/'),
+    Benchmark('top-products', lambda f: '/api/dashboard/top-products/'),
+    Benchmark('top-customers', lambda f: '/api/dashboard/top-customers/'),
+    Benchmark('revenue-stats', lambda f: '/api/dashboard/revenue/'),
+    Benchmark('revenue-stats-monthly', lambda f: '/api/dashboard/revenue/?granularity=month&from=2000-01-01'),
+    Benchmark('dashboard-cache-stats', lambda f: '/api/dashboard/cache-stats/'),
+
+    Benchmark('export-orders', lambda f: f"/api/export/orders/?from={f['week_ago']}", iterations=3),
+    Benchmark('export-products', lambda f: '/api/export/products/', iterations=3),
+    Benchmark('export-customers', lambda f: '/api/export/customers/', iterations=3),
+
+    Benchmark('metrics', lambda f: '/api/_metrics/'),
+]
+
+
+def load_fixtures():
+    """Ids of existing rows the benchmarks address, or None when the database has no orders."""
+    order = Order.objects.order_by('-id').first()
+    if order is None:
+        return None
+    product = Product.objects.order_by('-units_sold').first()
+    category = Category.objects.filter(pk=product.category_id).first()
+    return {
+        'order': order.pk,
+        'customer': order.customer_id,
+        'product': product.pk,
+        'products': list(Product.objects.filter(stock__gte=100).order_by('-units_sold').values_list('id', flat=True)[:3]),
+        'category': category.pk,
+        'root_category': int(category.path.split('/')[0]),
+        'search_term': product.name.split()[0],
+        'week_ago': (timezone.localdate() - timedelta(days=7)).isoformat(),
+    }
+
+
+def dataset_size():
+    return {
+        'categories': Category.objects.count(),
+        'products': Product.objects.count(),
+        'customers': Customer.objects.count(),
+        'orders': Order.objects.count(),
+        'order_items': OrderItem.objects.count(),
+    }
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def api_url_names(patterns, names=None):
+    names = set() if names is None else names
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            api_url_names(pattern.url_patterns, names)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+class BenchmarkRunner:
+    def __init__(self, fixtures, iterations=20, warm=False):
+        self.fixtures = fixtures
+        self.iterations = iterations
+        self.warm = warm
+        self.client = APIClient()
+
+    def request(self, benchmark, measure=False):
+        """
+        Send ``benchmark``'s request once; returns the response, its path and
+        the seconds it took. With ``measure`` it also returns the number of
+        queries and the peak traced memory of the request itself, not
+        counting the setup.
+        """
+        if not self.warm:
+            for cache in caches.all():
+                cache.clear()
+        with transaction.atomic():
+            context = dict(self.fixtures)
+            if benchmark.setup:
+                context.update(benchmark.setup(context))
+            path = benchmark.path(context)
+            data = benchmark.payload(context) if benchmark.payload else None
+            headers = benchmark.headers(context) if benchmark.headers else None
+
+            queries = CaptureQueriesContext(connection) if measure else nullcontext()
+            if measure:
+                tracemalloc.reset_peak()
+                allocated = tracemalloc.get_traced_memory()[0]
+            with override_settings(**benchmark.settings), queries:
+                started = time.perf_counter()
+                response = getattr(self.client, benchmark.method.lower())(
+                    path, data, format=benchmark.format, headers=headers
+                )
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] - allocated if measure else None
+
+            if benchmark.teardown:
+                benchmark.teardown(context, response)
+            # Writes are rolled back so that every iteration sees the same data
+            transaction.set_rollback(benchmark.writes)
+        if measure:
+            return response, path, elapsed, len(queries), peak
+        return response, path, elapsed
+
+    def run(self, benchmark):
+        # One untimed request first, so that imports and connection setup are not measured
+        self.request(benchmark)
+        timings = []
+        for _ in range(benchmark.iterations or self.iterations):
+            _, _, elapsed = self.request(benchmark)
+            timings.append(elapsed)
+
+        # Measured separately, tracing slows every allocation down
+        tracemalloc.start()
+        try:
+            response, path, _, queries, peak = self.request(benchmark, measure=True)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'url_name': resolve(path.split('?')[0]).url_name,
+            'method': benchmark.method,
+            'status': response.status_code,
+            'iterations': len(timings),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+            'max_ms': round(max(timings) * 1000, 3),
+            'queries': queries,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+
+def compare(baseline, current, tolerance, noise_ms=2.0):
+    """
+    Return the regressions of ``current`` against ``baseline`` results: p95
+    latency more than ``tolerance`` (a fraction) and ``noise_ms`` slower, or
+    more queries than before.
+    """
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        limit = before['p95_ms'] * (1 + tolerance)
+        if result['p95_ms'] > limit and result['p95_ms'] - before['p95_ms'] > noise_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+    return regressions
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+DATA_VERSION_KEY = 'api:data-version'
+LAST_WRITE_KEY = 'api:last-write'
+CATALOG_CHANGED_KEY = 'api:catalog-changed'
+STATS_KEY_PREFIX = 'api:cache-stats:'
+STATS = ('hit', 'stale', 'miss', 'not_modified')
+
+
+def get_cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+
+def get_data_version():
+    cache = get_cache()
+    # Seed from the clock so the version never goes backwards if the key is evicted
+    cache.add(DATA_VERSION_KEY, int(time.time() * 1000), timeout=None)
+    return cache.get(DATA_VERSION_KEY)
+
+
+def bump_data_version():
+    cache = get_cache()
+    cache.set(LAST_WRITE_KEY, time.time(), timeout=None)
+    try:
+        return cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.add(DATA_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        return cache.incr(DATA_VERSION_KEY)
+
+
+def seconds_since_last_write():
+    """Seconds since the data version was last bumped, None if not known."""
+    last_write = get_cache().get(LAST_WRITE_KEY)
+    return None if last_write is None else time.time() - last_write
+
+
+def mark_catalog_changed():
+    get_cache().set(CATALOG_CHANGED_KEY, time.time(), timeout=None)
+
+
+def catalog_changed_at():
+    """
+    When products, categories or their images last changed, None if not
+    known. Covers the changes the ``updated_at`` of the rows read does not
+    show, such as a renamed category, new renditions or stock taken by orders.
+    """
+    return get_cache().get(CATALOG_CHANGED_KEY)
+
+
+def catalog_validators(request, queryset):
+    """
+    Return the ``(etag, last_modified, count)`` of a catalog read of
+    ``queryset``, None when it is empty. They come from the newest ``updated_at`` and the
+    row count of the queryset and :func:`catalog_changed_at`, so checking
+    them takes one aggregate query and no serialization.
+    """
+    state = queryset.aggregate(last_updated=Max('updated_at'), count=Count('pk'))
+    if not state['count']:
+        return None
+    changed_at = catalog_changed_at()
+    last_modified = state['last_updated'].timestamp()
+    if changed_at is not None:
+        last_modified = max(last_modified, changed_at)
+    # The representation also depends on the URL (filters, pages, absolute
+    # image URLs) and on the renderer
+    key = '|'.join([
+        request.build_absolute_uri(), request.accepted_media_type,
+        str(state['count']), state['last_updated'].isoformat(), repr(changed_at)
+    ])
+    etag = '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+    return etag, int(last_modified), state['count']
+
+
+def record_stat(name):
+    cache = get_cache()
+    key = STATS_KEY_PREFIX + name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many([STATS_KEY_PREFIX + name for name in STATS])
+    return {name: values.get(STATS_KEY_PREFIX + name, 0) for name in STATS}
+
+
+def make_etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+    return '"%s"' % hashlib.md5(payload).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    candidates = {value.strip() for value in header.split(',')}
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def response_cache_key(view, request):
+    """
+    Key the cached response by view and query string, plus the local date for
+    views with ``cache_per_day`` set, whose windows are relative to today.
+    """
+    key = request.GET.urlencode()
+    if getattr(view, 'cache_per_day', False):
+        key += '|' + timezone.localdate().isoformat()
+    return 'api:response:%s:%s' % (type(view).__name__, hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def lookup_entry(key):
+    """
+    Return ``(entry, version, locked)`` for the response cached under ``key``.
+    ``entry`` is None when the caller has to recompute it, in which case
+    ``locked`` tells whether it holds the recompute lock and must release it.
+    """
+    cache = get_cache()
+    version = get_data_version()
+    entry = cache.get(key)
+
+    if entry is not None and entry['version'] == version:
+        record_stat('hit')
+        return entry, version, False
+
+    locked = cache.add(key + ':lock', 1, timeout=settings.DASHBOARD_CACHE_LOCK_TIMEOUT)
+    if entry is not None and not locked:
+        record_stat('stale')
+        return entry, version, False
+
+    record_stat('miss')
+    return None, version, locked
+
+
+def store_entry(key, version, data):
+    entry = {'version': version, 'data': data, 'etag': make_etag(data)}
+    get_cache().set(key, entry, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+def release_lock(key):
+    get_cache().delete(key + ':lock')
+
+
+def entry_headers(request, entry):
+    """Return the caching headers for ``entry`` and whether the client already has it."""
+    headers = {'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+    not_modified = etag_matches(request, entry['etag'])
+    if not_modified:
+        record_stat('not_modified')
+    return headers, not_modified
+
+
+def versioned_cache(view_method):
+    """
+    Cache a GET handler's response data against the data version counter.
+
+    A fresh entry is served as is. When the version has moved on, one request
+    takes a short lock and recomputes while concurrent requests keep getting
+    the stale entry. Responses carry an ETag and ``If-None-Match`` is answered
+    with 304.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(self, request)
+        entry, version, locked = lookup_entry(key)
+        if entry is None:
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                entry = store_entry(key, version, response.data)
+            finally:
+                if locked:
+                    release_lock(key)
+
+        headers, not_modified = entry_headers(request, entry)
+        if not_modified:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers=headers)
+
+    return wrapper
+
+
+def async_versioned_cache(view_method):
+    """
+    :func:`versioned_cache` for async handlers. The handler returns the
+    response data and signals errors by raising an APIException; the
+    wrapper renders both as JSON.
+    """
+    @wraps(view_method)
+    async def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(self, request)
+        entry, version, locked = await sync_to_async(lookup_entry)(key)
+        if entry is None:
+            try:
+                data = await view_method(self, request, *args, **kwargs)
+                entry = await sync_to_async(store_entry)(key, version, data)
+            except APIException as exc:
+                detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+                return JsonResponse(detail, status=exc.status_code, safe=False)
+            finally:
+                if locked:
+                    await sync_to_async(release_lock)(key)
+
+        headers, not_modified = entry_headers(request, entry)
+        if not_modified:
+            return HttpResponseNotModified(headers=headers)
+        return JsonResponse(entry['data'], headers=headers, safe=False)
+
+    return wrapper
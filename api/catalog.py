@@ -0,0 +1,167 @@
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Product, ProductImage
+
+
+# Upper bounds of the price facet bands; the last band is open ended
+PRICE_BANDS = [10, 25, 50, 100, 250, 500]
+
+CATEGORY_SUMMARY_KEY = 'api:category-summary:%s'
+CATEGORY_SUMMARY_TIMEOUT = 60 * 60
+PREVIEW_SIZE = 5
+
+
+def format_price(value):
+    return None if value is None else f'{value:.2f}'
+
+
+def empty_summary():
+    return {'count': 0, 'active_count': 0, 'min_price': None, 'max_price': None, 'products': []}
+
+
+def build_category_summaries(category_ids):
+    """
+    Compute the summaries of ``category_ids`` with one grouped aggregate and
+    one windowed preview query. Price range and preview cover active
+    products only.
+    """
+    summaries = {category_id: empty_summary() for category_id in category_ids}
+    if not summaries:
+        return summaries
+
+    # The summaries are cached until the next product write, so they are
+    # never computed from a replica that may not have caught up with it yet
+    products = Product.objects.using('default').filter(category_id__in=summaries)
+    totals = (
+        products
+        .values('category_id')
+        .annotate(
+            count=Count('id'),
+            active_count=Count('id', filter=Q(is_active=True)),
+            min_price=Min('price', filter=Q(is_active=True)),
+            max_price=Max('price', filter=Q(is_active=True))
+        )
+        .order_by()
+    )
+    for row in totals:
+        summary = summaries[row['category_id']]
+        summary['count'] = row['count']
+        summary['active_count'] = row['active_count']
+        summary['min_price'] = format_price(row['min_price'])
+        summary['max_price'] = format_price(row['max_price'])
+
+    preview = (
+        products
+        .filter(is_active=True)
+        .annotate(position=Window(RowNumber(), partition_by=F('category_id'), order_by=F('id').asc()))
+        .filter(position__lte=PREVIEW_SIZE)
+        .order_by('category_id', 'position')
+        .values('id', 'name', 'price', 'category_id')
+    )
+    for product in preview:
+        summaries[product['category_id']]['products'].append({
+            'id': product['id'],
+            'name': product['name'],
+            'price': format_price(product['price'])
+        })
+    return summaries
+
+
+def category_summaries(category_ids):
+    """Return cached summaries of ``category_ids``, computing the missing ones in bulk."""
+    keys = {category_id: CATEGORY_SUMMARY_KEY % category_id for category_id in category_ids}
+    cached = cache.get_many(keys.values())
+    summaries = {
+        category_id: cached[key]
+        for category_id, key in keys.items()
+        if key in cached
+    }
+
+    missing = [category_id for category_id in keys if category_id not in summaries]
+    if missing:
+        computed = build_category_summaries(missing)
+        cache.set_many(
+            {keys[category_id]: summary for category_id, summary in computed.items()},
+            timeout=CATEGORY_SUMMARY_TIMEOUT
+        )
+        summaries.update(computed)
+    return summaries
+
+
+def category_summary(category_id):
+    return category_summaries([category_id])[category_id]
+
+
+def invalidate_category_summaries(category_ids):
+    cache.delete_many([CATEGORY_SUMMARY_KEY % category_id for category_id in category_ids if category_id])
+
+
+def product_facets(queryset):
+    """
+    Count the products of ``queryset`` per category and price band, plus how
+    many are in stock and active, in a single grouped query.
+    """
+    bounds = [0] + PRICE_BANDS + [None]
+    bands = {}
+    for index, (lower, upper) in enumerate(zip(bounds, bounds[1:])):
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        bands[f'band_{index}'] = Count('id', filter=condition)
+
+    rows = (
+        queryset
+        .prefetch_related(None)
+        .order_by()
+        .values('category_id', 'category__name')
+        .annotate(
+            count=Count('id'),
+            in_stock=Count('id', filter=Q(stock__gt=0)),
+            active=Count('id', filter=Q(is_active=True)),
+            **bands
+        )
+    )
+
+    categories = []
+    band_counts = [0] * len(bands)
+    in_stock = active = 0
+    for row in rows:
+        categories.append({'id': row['category_id'], 'name': row['category__name'], 'count': row['count']})
+        in_stock += row['in_stock']
+        active += row['active']
+        for index in range(len(bands)):
+            band_counts[index] += row[f'band_{index}']
+
+    categories.sort(key=lambda category: (-category['count'], category['name']))
+    return {
+        'categories': categories,
+        'price_bands': [
+            {'min': bounds[index], 'max': bounds[index + 1], 'count': count}
+            for index, count in enumerate(band_counts)
+            if count
+        ],
+        'in_stock': in_stock,
+        'active': active
+    }
+
+
+def refresh_primary_image(product_id):
+    """Point the product's ``primary_image`` at its flagged image, or its first one when none is flagged."""
+    image_id = (
+        ProductImage.objects.filter(product_id=product_id)
+        .order_by('-is_primary', 'id')
+        .values_list('id', flat=True)
+        .first()
+    )
+    Product.objects.filter(pk=product_id).update(primary_image=image_id)
+    return image_id
+
+
+def unflag_primary_images(product_id, exclude=None):
+    """Clear ``is_primary`` on the product's images, so that another one can be flagged."""
+    images = ProductImage.objects.filter(product_id=product_id, is_primary=True)
+    if exclude is not None:
+        images = images.exclude(pk=exclude)
+    images.update(is_primary=False)
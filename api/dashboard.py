@@ -0,0 +1,118 @@
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ParseError
+
+from .analytics import fresh_snapshot, from_cents
+from .models import Customer, DailySalesRollup, Order
+from .revenue import (
+    CENTS, GRANULARITIES, MAX_BUCKETS, bucket_count, default_window, revenue_overview, revenue_series
+)
+from .serializers import OrderSerializer
+
+
+def parse_date_param(params, name):
+    """Return the parsed date, None when the parameter is absent, or False when it is invalid."""
+    if name not in params:
+        return None
+    try:
+        return parse_date(params[name]) or False
+    except ValueError:
+        return False
+
+
+def total_orders():
+    snapshot = fresh_snapshot()
+    if snapshot:
+        return snapshot.rows['orders']
+    return DailySalesRollup.objects.filter(
+        product__isnull=True
+    ).aggregate(total=Sum('order_count'))['total'] or 0
+
+
+def total_revenue():
+    snapshot = fresh_snapshot()
+    if snapshot:
+        return from_cents(snapshot.total('items', 'revenue'))
+    return DailySalesRollup.objects.filter(
+        product__isnull=False
+    ).aggregate(total=Sum('revenue'))['total'] or 0
+
+
+def recent_orders(limit=5):
+    orders = OrderSerializer.setup_eager_loading(Order.objects.all()).order_by('-created_at')[:limit]
+    return OrderSerializer(orders, many=True).data
+
+
+def top_customers(limit=10):
+    snapshot = fresh_snapshot()
+    if snapshot:
+        return top_customers_from_snapshot(snapshot, limit)
+
+    customers = Customer.objects.select_related('user').annotate(
+        order_count=Count('orders'),
+        total_spent=Sum('orders__total_price')
+    ).filter(order_count__gt=0).order_by('-total_spent')[:limit]
+    return [
+        {
+            'id': customer.id,
+            'username': customer.user.username,
+            'order_count': customer.order_count,
+            'total_spent': str(customer.total_spent.quantize(CENTS))
+        }
+        for customer in customers
+    ]
+
+
+def top_customers_from_snapshot(snapshot, limit):
+    order_counts = snapshot.sum_by('orders', 'customer')
+    top_spent = snapshot.top(snapshot.sum_by('orders', 'customer', 'total'), limit)
+    customers = Customer.objects.select_related('user').in_bulk([customer_id for customer_id, _ in top_spent])
+    return [
+        {
+            'id': customer_id,
+            'username': customers[customer_id].user.username,
+            'order_count': order_counts[customer_id],
+            'total_spent': str(from_cents(total))
+        }
+        for customer_id, total in top_spent
+        if customer_id in customers
+    ]
+
+
+def revenue_report(params):
+    """
+    Revenue buckets for the ``granularity``/``from``/``to`` query parameters,
+    or the daily, weekly and monthly overview when none is given.
+    """
+    today = timezone.localdate()
+    if not any(key in params for key in ('granularity', 'from', 'to')):
+        overview = revenue_overview(today)
+        return {
+            'daily': overview['day'],
+            'weekly': overview['week'],
+            'monthly': overview['month']
+        }
+
+    granularity = params.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ParseError(f"Invalid granularity, expected one of: {', '.join(GRANULARITIES)}")
+
+    date_from = parse_date_param(params, 'from')
+    date_to = parse_date_param(params, 'to')
+    if date_from is False or date_to is False:
+        raise ParseError("Invalid date, expected YYYY-MM-DD")
+
+    date_to = date_to or today
+    date_from = date_from or default_window(date_to, granularity)[0]
+    if date_from > date_to:
+        raise ParseError("'from' must not be after 'to'")
+    if bucket_count(date_from, date_to, granularity) > MAX_BUCKETS:
+        raise ParseError(f"Requested window exceeds {MAX_BUCKETS} buckets")
+
+    return {
+        'granularity': granularity,
+        'from': date_from.strftime('%Y-%m-%d'),
+        'to': date_to.strftime('%Y-%m-%d'),
+        'revenue': revenue_series(date_from, date_to, granularity)
+    }
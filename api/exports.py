@@ -0,0 +1,128 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the value back, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_stream(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+ORDER_CSV_HEADER = [
+    'order_id', 'customer_id', 'customer_username', 'status', 'total_price',
+    'shipping_address', 'payment_method', 'created_at', 'updated_at',
+    'item_id', 'product_id', 'product_name', 'quantity', 'price'
+]
+
+
+def order_record(order):
+    return {
+        'id': order.id,
+        'customer': order.customer_id,
+        'customer_username': order.customer.user.username,
+        'status': order.status,
+        'total_price': order.total_price,
+        'shipping_address': order.shipping_address,
+        'payment_method': order.payment_method,
+        'items': [
+            {
+                'id': item.id,
+                'product': item.product_id,
+                'product_name': item.product.name,
+                'quantity': item.quantity,
+                'price': item.price
+            }
+            for item in order.items.all()
+        ],
+        'created_at': order.created_at,
+        'updated_at': order.updated_at
+    }
+
+
+def order_csv_rows(orders):
+    """One row per order item; orders without items get a single row with empty item columns."""
+    for order in orders:
+        record = order_record(order)
+        base = [
+            record['id'], record['customer'], record['customer_username'], record['status'],
+            record['total_price'], record['shipping_address'], record['payment_method'],
+            record['created_at'].isoformat(), record['updated_at'].isoformat()
+        ]
+        if not record['items']:
+            yield base + [''] * 5
+        for item in record['items']:
+            yield base + [item['id'], item['product'], item['product_name'], item['quantity'], item['price']]
+
+
+PRODUCT_CSV_HEADER = [
+    'id', 'name', 'description', 'price', 'discount_price', 'category_id',
+    'category_name', 'stock', 'is_active', 'created_at', 'updated_at'
+]
+
+
+def product_record(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'discount_price': product.discount_price,
+        'category': product.category_id,
+        'category_name': product.category.name,
+        'stock': product.stock,
+        'is_active': product.is_active,
+        'created_at': product.created_at,
+        'updated_at': product.updated_at
+    }
+
+
+def product_csv_rows(products):
+    for product in products:
+        record = product_record(product)
+        record['created_at'] = record['created_at'].isoformat()
+        record['updated_at'] = record['updated_at'].isoformat()
+        yield list(record.values())
+
+
+CUSTOMER_CSV_HEADER = [
+    'id', 'user_id', 'username', 'email', 'phone', 'address', 'created_at', 'updated_at'
+]
+
+
+def customer_record(customer):
+    return {
+        'id': customer.id,
+        'user': customer.user_id,
+        'username': customer.user.username,
+        'email': customer.user.email,
+        'phone': customer.phone,
+        'address': customer.address,
+        'created_at': customer.created_at,
+        'updated_at': customer.updated_at
+    }
+
+
+def customer_csv_rows(customers):
+    for customer in customers:
+        record = customer_record(customer)
+        record['created_at'] = record['created_at'].isoformat()
+        record['updated_at'] = record['updated_at'].isoformat()
+        yield list(record.values())
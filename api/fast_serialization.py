@@ -0,0 +1,155 @@
+from collections import defaultdict
+from functools import cache
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from .images import rendition_urls
+from .models import Category, Product
+
+
+# ORM path of the value each model's __str__ returns, for StringRelatedFields
+STR_FIELDS = {
+    Category: 'name',
+    Product: 'name',
+    User: 'username',
+}
+
+
+def file_url(name, context):
+    """What ``FileField.to_representation`` returns for the stored file ``name``."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def to_string(value, context):
+    return str(value)
+
+
+def field_representation(field):
+    def convert(value, context):
+        return field.to_representation(value)
+    return convert
+
+
+# Representations of SerializerMethodFields: the ORM path they read and how
+# to turn its value into the output. They must match the serializer's method.
+METHOD_FIELDS = {
+    'renditions': ('renditions', lambda renditions, context: rendition_urls(renditions, context.get('request'))),
+}
+
+
+class SerializerPlan:
+    """
+    A precompiled read path for ``serializer_class``: the ``values()`` paths
+    its fields read and, per field, how to turn a row into the field's
+    output. :meth:`represent` produces the same data as the serializer's
+    ``to_representation`` without creating model instances or bound fields
+    per row. Nested collections are loaded with one extra query each.
+
+    Compiling fails for fields it cannot reproduce, the equivalence tests
+    keep the plans in line with the serializers.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.paths = ['pk']
+        self.fields = []
+        self.nested = []
+        for name, field in serializer_class().fields.items():
+            if not field.write_only:
+                self.compile(name, field)
+
+    def add_path(self, path):
+        if path not in self.paths:
+            self.paths.append(path)
+        return self.paths.index(path)
+
+    def compile(self, name, field):
+        if isinstance(field, serializers.ListSerializer):
+            relation = self.model._meta.get_field(field.source)
+            plan = SerializerPlan(type(field.child))
+            plan.parent_path = plan.add_path(relation.field.name)
+            self.nested.append((name, relation, plan))
+            self.fields.append((name, None, None))
+            return
+
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in METHOD_FIELDS:
+                raise ValueError(f'No fast representation for {self.serializer_class.__name__}.{name}')
+            path, convert = METHOD_FIELDS[name]
+            self.fields.append((name, self.add_path(path), convert))
+            return
+
+        path = '__'.join(field.source_attrs)
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            convert = None
+        elif isinstance(field, serializers.SlugRelatedField):
+            path, convert = f'{path}__{field.slug_field}', None
+        elif isinstance(field, serializers.StringRelatedField):
+            target = self.path_target(path)
+            if target is not None:
+                path = f'{path}__{STR_FIELDS[target]}'
+            convert = to_string
+        elif isinstance(field, serializers.FileField):
+            convert = file_url
+        elif isinstance(field, (serializers.Serializer, serializers.RelatedField)):
+            raise ValueError(f'No fast representation for {self.serializer_class.__name__}.{name}')
+        else:
+            convert = field_representation(field)
+        self.fields.append((name, self.add_path(path), convert))
+
+    def path_target(self, path):
+        """The model ``path`` leads to when it ends at a relation, None when it ends at a column."""
+        model = self.model
+        for part in path.split('__'):
+            field = model._meta.get_field(part)
+            if not field.is_relation:
+                return None
+            model = field.related_model
+        return model
+
+    def rows(self, queryset):
+        """``queryset`` as the value tuples :meth:`represent` takes."""
+        return queryset.select_related(None).prefetch_related(None).values_list(*self.paths)
+
+    def represent(self, rows, context):
+        rows = list(rows)
+        nested = {
+            name: self.load_nested(relation, plan, [row[0] for row in rows], context)
+            for name, relation, plan in self.nested
+        }
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, convert in self.fields:
+                if index is None:
+                    item[name] = nested[name].get(row[0], [])
+                    continue
+                value = row[index]
+                item[name] = None if value is None else (value if convert is None else convert(value, context))
+            data.append(item)
+        return data
+
+    def load_nested(self, relation, plan, parent_ids, context):
+        if not parent_ids:
+            return {}
+        queryset = relation.related_model._default_manager.filter(**{f'{relation.field.name}__in': parent_ids})
+        loader = getattr(plan.serializer_class, 'setup_eager_loading', None)
+        if loader is not None:
+            queryset = loader(queryset)
+        rows = list(plan.rows(queryset))
+        grouped = defaultdict(list)
+        for row, item in zip(rows, plan.represent(rows, context)):
+            grouped[row[plan.parent_path]].append(item)
+        return grouped
+
+
+@cache
+def serializer_plan(serializer_class):
+    return SerializerPlan(serializer_class)
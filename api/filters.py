@@ -0,0 +1,79 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ParseError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Category
+
+
+BOOLEAN_VALUES = {'true': True, 'false': False}
+
+
+def parse_decimal(params, name):
+    try:
+        value = Decimal(params[name])
+    except (InvalidOperation, ValueError):
+        raise ParseError(f"Invalid {name}")
+    if not value.is_finite():
+        raise ParseError(f"Invalid {name}")
+    return value
+
+
+def parse_boolean(params, name):
+    try:
+        return BOOLEAN_VALUES[params[name]]
+    except KeyError:
+        raise ParseError(f"Invalid {name}, expected 'true' or 'false'")
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Server-side product filters:
+
+    * ``category`` (with ``include_descendants=true`` for the whole subtree)
+    * ``min_price``/``max_price`` and ``min_discount_price``/``max_discount_price``
+    * ``in_stock=true`` and ``is_active=true|false``
+    * ``ordering`` by one of :attr:`ordering_fields`, ``-`` for descending
+    """
+    range_filters = {
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+        'min_discount_price': 'discount_price__gte',
+        'max_discount_price': 'discount_price__lte',
+    }
+    ordering_fields = ('price', 'created_at', 'name', 'units_sold', 'stock')
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if 'category' in params:
+            queryset = self.filter_category(queryset, params)
+
+        for name, lookup in self.range_filters.items():
+            if name in params:
+                queryset = queryset.filter(**{lookup: parse_decimal(params, name)})
+
+        if 'in_stock' in params and parse_boolean(params, 'in_stock'):
+            queryset = queryset.filter(stock__gt=0)
+        if 'is_active' in params:
+            queryset = queryset.filter(is_active=parse_boolean(params, 'is_active'))
+
+        if 'ordering' in params:
+            ordering = params['ordering']
+            if ordering.lstrip('-') not in self.ordering_fields:
+                raise ParseError(f"Invalid ordering, expected one of: {', '.join(self.ordering_fields)}")
+            queryset = queryset.order_by(ordering, 'id')
+        return queryset
+
+    def filter_category(self, queryset, params):
+        try:
+            category_id = int(params['category'])
+        except ValueError:
+            raise ParseError("Invalid category")
+        if params.get('include_descendants') != 'true':
+            return queryset.filter(category_id=category_id)
+
+        path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        return queryset.filter(category__path__startswith=path)
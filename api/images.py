@@ -0,0 +1,212 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import mark_catalog_changed
+from .models import Category, ProductImage
+
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes; images are scaled down to fit, never up
+RENDITIONS = {
+    'thumbnail': (150, 150),
+    'list': (400, 400),
+    'detail': (1200, 1200),
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+IMAGE_MODELS = (ProductImage, Category)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Striped, so that images with the same content are processed one at a time
+_hash_locks = [threading.Lock() for _ in range(64)]
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.open('rb')
+    try:
+        for chunk in file.chunks():
+            digest.update(chunk)
+    finally:
+        file.close()
+    return digest.hexdigest()
+
+
+def rendition_path(image_hash, name, extension):
+    # Keyed by content, so identical uploads share their renditions
+    return f'renditions/{image_hash[:2]}/{image_hash}/{name}.{extension}'
+
+
+def encode(image, extension):
+    if extension == 'jpeg' and image.mode == 'RGBA':
+        # JPEG has no alpha channel, flatten onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    output = io.BytesIO()
+    image.save(output, **FORMATS[extension])
+    return output.getvalue()
+
+
+def open_original(file):
+    file.open('rb')
+    try:
+        with Image.open(file) as image:
+            # Decode at a reduced scale where the format allows it (JPEG)
+            image.draft('RGB', max(RENDITIONS.values()))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            image.load()
+            return image
+    finally:
+        file.close()
+
+
+def create_renditions(file, image_hash):
+    """Store the missing renditions of ``file``; returns ``{rendition: {extension: path}}``."""
+    paths = {
+        name: {extension: rendition_path(image_hash, name, extension) for extension in FORMATS}
+        for name in RENDITIONS
+    }
+    missing = {
+        (name, extension) for name in RENDITIONS for extension in FORMATS
+        if not default_storage.exists(paths[name][extension])
+    }
+    if not missing:
+        return paths
+
+    image = open_original(file)
+    # Largest first, each rendition is scaled down from the previous one
+    for name, size in sorted(RENDITIONS.items(), key=lambda item: item[1], reverse=True):
+        image = image.copy()
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        for extension in FORMATS:
+            if (name, extension) in missing:
+                paths[name][extension] = default_storage.save(
+                    paths[name][extension], ContentFile(encode(image, extension))
+                )
+    return paths
+
+
+def other_images(model, instance):
+    queryset = model.objects.all()
+    return queryset.exclude(pk=instance.pk) if isinstance(instance, model) else queryset
+
+
+def file_in_use(name, instance):
+    return any(other_images(model, instance).filter(image=name).exists() for model in IMAGE_MODELS)
+
+
+def canonical_file(image_hash, instance):
+    """The stored file of another image with the same content, if any."""
+    for model in IMAGE_MODELS:
+        name = (
+            other_images(model, instance)
+            .filter(image_hash=image_hash)
+            .exclude(image='')
+            .values_list('image', flat=True)
+            .first()
+        )
+        if name and name != instance.image.name and default_storage.exists(name):
+            return name
+    return None
+
+
+def process_image(model, pk):
+    """
+    Hash the image of ``model`` ``pk``, point it at an identical file stored
+    earlier if there is one (deleting its own copy once that is committed)
+    and record its renditions, creating those that do not exist yet. Nothing
+    is recorded when the image was replaced in the meantime, the new upload
+    is processed by its own job.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return
+    original = instance.image.name
+    image_hash = content_hash(instance.image)
+    with _hash_locks[int(image_hash[:8], 16) % len(_hash_locks)]:
+        name = canonical_file(image_hash, instance)
+        if name:
+            instance.image.name = name
+        renditions = create_renditions(instance.image, image_hash)
+        with transaction.atomic():
+            updated = model.objects.filter(pk=pk, image=original).update(
+                image=instance.image.name, image_hash=image_hash, renditions=renditions
+            )
+            if updated and name:
+                transaction.on_commit(lambda: delete_unused_file(original, instance))
+    if updated:
+        mark_catalog_changed()
+
+
+def delete_unused_file(name, instance):
+    if not file_in_use(name, instance):
+        default_storage.delete(name)
+
+
+def run_job(model, pk):
+    close_old_connections()
+    try:
+        process_image(model, pk)
+    except Exception:
+        logger.exception('Could not create renditions for %s %s', model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_RENDITION_WORKERS,
+                thread_name_prefix='image-renditions'
+            )
+    return _executor
+
+
+def schedule_renditions(instances):
+    """
+    Process the new images among ``instances`` (those without an image
+    hash) once the current transaction commits, in the worker pool or, with
+    IMAGE_RENDITION_WORKERS = 0, right away. Pillow releases the GIL while
+    decoding, resizing and encoding, so the worker threads do run in parallel.
+    """
+    jobs = [(type(instance), instance.pk) for instance in instances if instance.image and not instance.image_hash]
+    if not jobs:
+        return
+
+    def submit():
+        for model, pk in jobs:
+            if settings.IMAGE_RENDITION_WORKERS:
+                get_executor().submit(run_job, model, pk)
+            else:
+                process_image(model, pk)
+    transaction.on_commit(submit)
+
+
+def rendition_urls(renditions, request=None):
+    """The ``renditions`` of an image as ``{rendition: {extension: url}}``; empty until they exist."""
+    def url(path):
+        location = default_storage.url(path)
+        return request.build_absolute_uri(location) if request is not None else location
+    return {
+        name: {extension: url(path) for extension, path in formats.items()}
+        for name, formats in renditions.items()
+    }
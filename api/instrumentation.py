@@ -0,0 +1,261 @@
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+
+logger = logging.getLogger('api.slow_queries')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STACK_DEPTH = 5
+
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """Normalize ``sql`` so that queries differing only in their parameters compare equal."""
+    return NUMBER_RE.sub('N', PLACEHOLDER_LIST_RE.sub('(...)', sql))
+
+
+def query_origin():
+    """The innermost project frames that led to the current query, innermost last."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and frame.filename != __file__
+        and 'site-packages' not in frame.filename
+    ]
+    return [
+        f'{frame.filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}'
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+class RequestMetrics:
+    """Database and serializer cost of one request. Queries may be recorded from several threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.slow_queries = 0
+        self.serializer_time = 0.0
+
+    def record_query(self, sql, duration, slow):
+        with self.lock:
+            self.queries += 1
+            self.sql_time += duration
+            self.fingerprints[fingerprint(sql)] += 1
+            self.slow_queries += slow
+
+    def duplicates(self):
+        """Number of queries that repeat an earlier one with the same fingerprint."""
+        return sum(count - 1 for count in self.fingerprints.values() if count > 1)
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.2f};desc="{self.queries} queries, {self.duplicates()} duplicates"',
+            f'serializer;dur={self.serializer_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Connection execute wrapper attributing every query to the request being handled."""
+    metrics = current_metrics.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        slow = threshold is not None and duration * 1000 >= threshold
+        if metrics is not None:
+            metrics.record_query(sql, duration, slow)
+        if slow:
+            logger.warning(
+                'Slow query (%.1f ms): %s\n  %s',
+                duration * 1000, sql, '\n  '.join(query_origin()) or '<no project frames>'
+            )
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """``connection_created`` receiver adding :func:`execute_wrapper` to every new connection."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block to the current request's serializer time.
+    The list and retrieve paths of :mod:`api.views` wrap the code producing
+    their response data with it.
+    """
+    metrics = current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = Counter()
+        self.duration_buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duplicates = 0
+        self.slow_queries = 0
+        self.serializer_time = 0.0
+
+
+class MetricsRegistry:
+    """
+    Per-view totals of the requests handled by this process, exposed in the
+    Prometheus text format. Each worker process keeps its own registry.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+
+    def observe(self, view, method, status_code, duration, metrics):
+        with self.lock:
+            totals = self.views[(view, method)]
+            totals.requests[status_code] += 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals.duration_buckets[index] += 1
+            totals.duration_sum += duration
+            totals.queries += metrics.queries
+            totals.sql_time += metrics.sql_time
+            totals.duplicates += metrics.duplicates()
+            totals.slow_queries += metrics.slow_queries
+            totals.serializer_time += metrics.serializer_time
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{{{labels}}} {value}' for labels, value in samples)
+
+        with self.lock:
+            views = sorted(self.views.items())
+            metric('api_requests_total', 'counter', 'Requests handled.', [
+                (f'view="{view}",method="{method}",status="{status_code}"', count)
+                for (view, method), totals in views
+                for status_code, count in sorted(totals.requests.items())
+            ])
+
+            lines.append('# HELP api_request_duration_seconds Time spent handling requests.')
+            lines.append('# TYPE api_request_duration_seconds histogram')
+            for (view, method), totals in views:
+                labels = f'view="{view}",method="{method}"'
+                for bound, count in zip(DURATION_BUCKETS, totals.duration_buckets):
+                    lines.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                count = sum(totals.requests.values())
+                lines.append(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'api_request_duration_seconds_sum{{{labels}}} {totals.duration_sum:.6f}')
+                lines.append(f'api_request_duration_seconds_count{{{labels}}} {count}')
+
+            for name, attribute, help_text in (
+                ('api_db_queries_total', 'queries', 'Database queries run.'),
+                ('api_db_duplicate_queries_total', 'duplicates', 'Queries repeating an earlier query of the same request.'),
+                ('api_db_slow_queries_total', 'slow_queries', 'Queries slower than SLOW_QUERY_THRESHOLD_MS.'),
+                ('api_db_duration_seconds_total', 'sql_time', 'Time spent in database queries.'),
+                ('api_serializer_duration_seconds_total', 'serializer_time', 'Time spent producing serializer data.'),
+            ):
+                metric(name, 'counter', help_text, [
+                    (f'view="{view}",method="{method}"', round(getattr(totals, attribute), 6))
+                    for (view, method), totals in views
+                ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_label(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, current_metrics.set(metrics)
+
+
+def finish_request(request, response, metrics, token):
+    current_metrics.reset(token)
+    duration = time.perf_counter() - metrics.started
+    response['Server-Timing'] = metrics.server_timing(duration)
+    registry.observe(view_label(request), request.method, response.status_code, duration, metrics)
+    return response
+
+
+class InstrumentationMiddleware:
+    """
+    Record each request's query count, SQL time, duplicate queries and
+    serializer time, report them in a ``Server-Timing`` header and add them
+    to the per-view totals served by :func:`metrics_view`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = start_request()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            current_metrics.reset(token)
+            raise
+        return finish_request(request, response, metrics, token)
+
+    async def __acall__(self, request):
+        metrics, token = start_request()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            current_metrics.reset(token)
+            raise
+        return finish_request(request, response, metrics, token)
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
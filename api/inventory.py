@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import mark_catalog_changed
+from .models import Product
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Insufficient stock'
+    default_code = 'insufficient_stock'
+
+    def __init__(self, shortages):
+        super().__init__()
+        self.shortages = shortages
+        self.detail = {'detail': self.default_detail, 'items': shortages}
+
+
+def order_quantities(items):
+    """Units per product id for validated order item data."""
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item['product'].pk] += item['quantity']
+    return quantities
+
+
+def lock_products(product_ids):
+    """Lock the rows of ``product_ids`` up front, in id order."""
+    list(
+        Product.objects.filter(pk__in=product_ids)
+        .order_by('id')
+        .select_for_update()
+        .values_list('id', flat=True)
+    )
+
+
+def stock_deltas(before, after):
+    deltas = defaultdict(int)
+    for product_id, units in after.items():
+        deltas[product_id] += units
+    for product_id, units in before.items():
+        deltas[product_id] -= units
+    return deltas
+
+
+def stock_shortages(before, after):
+    """
+    The shortages :func:`apply_stock_delta` would currently raise
+    InsufficientStock with for ``before`` and ``after``, without taking any
+    stock. For validating forms up front.
+    """
+    needed = {product_id: units for product_id, units in stock_deltas(before, after).items() if units > 0}
+    available = dict(Product.objects.filter(pk__in=needed).values_list('id', 'stock'))
+    return [
+        {'product': product_id, 'requested': needed[product_id], 'available': available.get(product_id, 0)}
+        for product_id in sorted(needed)
+        if available.get(product_id, 0) < needed[product_id]
+    ]
+
+
+@transaction.atomic
+def apply_stock_delta(before, after):
+    """
+    Move Product.stock from the ``before`` to the ``after`` reservations
+    ({product_id: units}), all or nothing.
+
+    Stock is only ever taken with a conditional ``stock >= n`` UPDATE, so
+    concurrent orders cannot oversell, and products are updated in id order
+    so concurrent writers take row locks in the same order. Raises
+    InsufficientStock listing every product that is short.
+    """
+    deltas = stock_deltas(before, after)
+    short = []
+    for product_id in sorted(deltas):
+        units = deltas[product_id]
+        if units > 0:
+            taken = Product.objects.filter(pk=product_id, stock__gte=units).update(stock=F('stock') - units)
+            if not taken:
+                short.append(product_id)
+        elif units < 0:
+            Product.objects.filter(pk=product_id).update(stock=F('stock') - units)
+    if deltas:
+        transaction.on_commit(mark_catalog_changed)
+
+    if short:
+        available = dict(Product.objects.filter(pk__in=short).values_list('id', 'stock'))
+        raise InsufficientStock([
+            {'product': product_id, 'requested': deltas[product_id], 'available': available.get(product_id, 0)}
+            for product_id in short
+        ])
+
+
+def reserve_stock(quantities):
+    apply_stock_delta({}, quantities)
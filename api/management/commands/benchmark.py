@@ -0,0 +1,90 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api import urls
+from api.benchmarks import (
+    BENCHMARKS, BenchmarkRunner, api_url_names, compare, dataset_size, load_fixtures
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every API endpoint against the current database and record p50/p95 latency, query '
+        'counts and peak memory as JSON. Run generate_data first. Writes are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--only', nargs='+', metavar='NAME', help='Run only these benchmarks')
+        parser.add_argument('--warm', action='store_true', help='Keep caches between requests')
+        parser.add_argument('--output', help='Write the results to this JSON file, e.g. a new baseline')
+        parser.add_argument('--compare', metavar='BASELINE', help='Fail when results regress against this JSON file')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed p95 slowdown against the baseline, as a fraction (default 0.2)'
+        )
+
+    def handle(self, *args, **options):
+        fixtures = load_fixtures()
+        if fixtures is None:
+            raise CommandError('The database has no orders, run generate_data first.')
+
+        benchmarks = BENCHMARKS
+        if options['only']:
+            benchmarks = [benchmark for benchmark in BENCHMARKS if benchmark.name in options['only']]
+            unknown = set(options['only']) - {benchmark.name for benchmark in benchmarks}
+            if unknown:
+                raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+        runner = BenchmarkRunner(fixtures, iterations=max(options['iterations'], 1), warm=options['warm'])
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for benchmark in benchmarks:
+                result = runner.run(benchmark)
+                results[benchmark.name] = result
+                self.stdout.write(
+                    f"{benchmark.name:<28} {result['status']:>4} {result['p50_ms']:>9.1f} ms p50 "
+                    f"{result['p95_ms']:>9.1f} ms p95 {result['queries']:>5} queries "
+                    f"{result['peak_memory_kb']:>10.1f} KiB"
+                )
+                if result['status'] >= 400:
+                    self.stderr.write(f"{benchmark.name} returned {result['status']}")
+
+        if not options['only']:
+            uncovered = api_url_names(urls.urlpatterns) - {result['url_name'] for result in results.values()}
+            if uncovered:
+                self.stderr.write(f"Endpoints without a benchmark: {', '.join(sorted(uncovered))}")
+
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': runner.iterations,
+                'warm': runner.warm,
+                'dataset': dataset_size(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Wrote {options['output']}.")
+
+        if options['compare']:
+            with open(options['compare']) as source:
+                baseline = json.load(source)
+            regressions = compare(baseline['results'], results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.analytics import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Export orders and order items into the columnar analytics snapshot used by the dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.ANALYTICS_SNAPSHOT_PATH,
+            help='Snapshot file to write, defaults to ANALYTICS_SNAPSHOT_PATH'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and rebuild the snapshot every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('No snapshot path given and ANALYTICS_SNAPSHOT_PATH is not set.')
+
+        while True:
+            started = time.monotonic()
+            counts = build_snapshot(path)
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {counts['orders']} orders and {counts['items']} order items to {path} "
+                f"in {time.monotonic() - started:.2f}s."
+            ))
+            if options['interval'] <= 0:
+                return
+            close_old_connections()
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
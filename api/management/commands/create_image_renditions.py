@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_MODELS, run_job
+
+
+class Command(BaseCommand):
+    help = 'Create the renditions of product and category images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Process every image again, restoring renditions missing from storage'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=max(settings.IMAGE_RENDITION_WORKERS, 1),
+            help='Number of worker threads'
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in IMAGE_MODELS:
+            images = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['all']:
+                images = images.filter(image_hash='')
+            jobs.extend((model, pk) for pk in images.values_list('pk', flat=True).iterator())
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            for _ in executor.map(lambda job: run_job(*job), jobs):
+                pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(jobs)} images.'))
@@ -0,0 +1,248 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import Category, Customer, Order, OrderItem, Product
+
+
+# Full-scale sizes; --scale multiplies all but the category count
+DEFAULTS = {
+    'categories': 500,
+    'products': 1_000_000,
+    'customers': 100_000,
+    'items': 10_000_000,
+}
+
+STATUS_WEIGHTS = {
+    'delivered': 60,
+    'shipped': 15,
+    'processing': 10,
+    'pending': 10,
+    'cancelled': 5,
+}
+ITEMS_PER_ORDER = [1, 2, 3, 4, 5, 6]
+ITEMS_PER_ORDER_WEIGHTS = [30, 25, 20, 12, 8, 5]
+PAYMENT_METHODS = ['card', 'paypal', 'bank_transfer', 'cash_on_delivery']
+WORDS = [
+    'smart', 'wireless', 'classic', 'premium', 'compact', 'portable', 'organic', 'vintage', 'ultra',
+    'eco', 'pro', 'mini', 'deluxe', 'digital', 'steel', 'cotton', 'leather', 'bamboo', 'solar', 'hybrid'
+]
+NOUNS = [
+    'phone', 'lamp', 'chair', 'kettle', 'speaker', 'backpack', 'watch', 'camera', 'desk', 'blender',
+    'jacket', 'sneaker', 'monitor', 'keyboard', 'mug', 'tent', 'bottle', 'drone', 'guitar', 'router'
+]
+
+
+@contextmanager
+def historical_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values set on the objects."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative weights giving the n-th most popular entry a share proportional to 1 / n**exponent."""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset (category tree, products, customers, orders) with skewed '
+        'popularity, for benchmarking. Sizes default to 1M products, 100k customers and 10M order '
+        'items; use --scale for smaller runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Multiplier applied to the default number of products, customers and items'
+        )
+        for name, default in DEFAULTS.items():
+            parser.add_argument(f'--{name}', type=int, help=f'Number of {name} (default {default:,})')
+        parser.add_argument('--max-depth', type=int, default=6, help='Depth of the category tree')
+        parser.add_argument('--days', type=int, default=730, help='Spread orders over this many past days')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, runs with the same seed are identical')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk_create')
+
+    def handle(self, *args, **options):
+        sizes = {
+            name: options[name] if options[name] is not None else default
+            for name, default in DEFAULTS.items()
+        }
+        for name in ('products', 'customers', 'items'):
+            if options[name] is None:
+                sizes[name] = max(int(sizes[name] * options['scale']), 1)
+        self.random = random.Random(options['seed'])
+        self.chunk_size = max(options['chunk_size'], 1)
+        self.verbosity = options['verbosity']
+        self.now = timezone.now()
+        self.span = timedelta(days=max(options['days'], 1)).total_seconds()
+
+        started = time.monotonic()
+        with historical_timestamps(Category, Product, Customer, Order, OrderItem):
+            category_ids = self.create_categories(sizes['categories'], max(options['max_depth'], 1))
+            products = self.create_products(sizes['products'], category_ids)
+            customer_ids = self.create_customers(sizes['customers'])
+            self.create_orders(sizes['items'], products, customer_ids)
+
+        self.stdout.write('Rebuilding derived data...')
+        call_command('rebuild_sales_rollup', stdout=self.stdout)
+        call_command('reconcile_product_sales', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset in {time.monotonic() - started:.0f}s.'))
+
+    def timestamp(self):
+        # Skewed towards the present, like a growing shop
+        return self.now - timedelta(seconds=self.random.triangular(0, self.span, 0))
+
+    def in_chunks(self, model, objects):
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) == self.chunk_size:
+                yield model.objects.bulk_create(chunk)
+                chunk = []
+        if chunk:
+            yield model.objects.bulk_create(chunk)
+
+    def create_categories(self, count, max_depth):
+        """Create a tree ``max_depth`` levels deep, level by level so that every parent's path is known."""
+        levels = [[] for _ in range(max_depth)]
+        levels[0].append(None)
+        for _ in range(count - 1):
+            depth = self.random.randrange(max_depth)
+            while depth and not levels[depth - 1]:
+                depth -= 1
+            levels[depth].append(self.random.randrange(len(levels[depth - 1])) if depth else None)
+
+        created = []
+        parents = []
+        for depth, parent_indexes in enumerate(levels):
+            categories = []
+            for position, parent_index in enumerate(parent_indexes):
+                created_at = self.now - timedelta(seconds=self.span)
+                categories.append(Category(
+                    name=f'Category {depth}.{position}',
+                    description='',
+                    parent=parents[parent_index] if parent_index is not None else None,
+                    depth=depth,
+                    created_at=created_at,
+                    updated_at=created_at
+                ))
+            with transaction.atomic():
+                Category.objects.bulk_create(categories, batch_size=self.chunk_size)
+                for category in categories:
+                    parent_path = category.parent.path if category.parent else ''
+                    category.path = f'{parent_path}{category.pk}/'
+                Category.objects.bulk_update(categories, ['path'], batch_size=self.chunk_size)
+            created.extend(categories)
+            parents = categories
+        self.stdout.write(f'Created {len(created)} categories, {sum(1 for level in levels if level)} levels deep.')
+        return [category.pk for category in created]
+
+    def create_products(self, count, category_ids):
+        """Create the products; returns ``(id, price)`` pairs ordered from most to least popular."""
+        def products():
+            for number in range(count):
+                price = Decimal(f'{self.random.lognormvariate(3.5, 1.0) + 1:.2f}')
+                created_at = self.timestamp()
+                yield Product(
+                    name=f'{self.random.choice(WORDS).title()} {self.random.choice(NOUNS)} {number}',
+                    description=f'{self.random.choice(WORDS)} {self.random.choice(WORDS)} {self.random.choice(NOUNS)}',
+                    price=price,
+                    discount_price=(price * Decimal('0.8')).quantize(Decimal('0.01')) if self.random.random() < 0.2 else None,
+                    category_id=self.random.choice(category_ids),
+                    stock=0 if self.random.random() < 0.05 else self.random.randint(1, 1000),
+                    is_active=self.random.random() < 0.9,
+                    created_at=created_at,
+                    updated_at=created_at
+                )
+
+        created = []
+        for chunk in self.in_chunks(Product, products()):
+            created.extend((product.pk, product.price) for product in chunk)
+        self.random.shuffle(created)
+        self.stdout.write(f'Created {len(created)} products.')
+        return created
+
+    def create_customers(self, count):
+        first = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        users = []
+        for chunk in self.in_chunks(User, (
+            User(username=f'customer{first + number}', email=f'customer{first + number}@example.com', password='!')
+            for number in range(count)
+        )):
+            users.extend(chunk)
+
+        customer_ids = []
+        for chunk in self.in_chunks(Customer, (
+            Customer(user=user, phone=f'+1555{user.pk:07d}', address=f'{user.pk} Main street',
+                     created_at=self.now, updated_at=self.now)
+            for user in users
+        )):
+            customer_ids.extend(customer.pk for customer in chunk)
+        self.random.shuffle(customer_ids)
+        self.stdout.write(f'Created {len(customer_ids)} customers.')
+        return customer_ids
+
+    def create_orders(self, item_count, products, customer_ids):
+        product_weights = zipf_cum_weights(len(products), 1.1)
+        customer_weights = zipf_cum_weights(len(customer_ids), 0.8)
+        statuses = list(STATUS_WEIGHTS)
+        status_weights = list(STATUS_WEIGHTS.values())
+
+        orders_created = items_created = 0
+        while items_created < item_count:
+            orders, order_items = [], []
+            while len(orders) < self.chunk_size and items_created < item_count:
+                size = min(self.random.choices(ITEMS_PER_ORDER, ITEMS_PER_ORDER_WEIGHTS)[0], item_count - items_created)
+                created_at = self.timestamp()
+                lines = [
+                    (product_id, price, self.random.choice([1, 1, 1, 2, 3]))
+                    for product_id, price in self.random.choices(products, cum_weights=product_weights, k=size)
+                ]
+                orders.append(Order(
+                    customer_id=self.random.choices(customer_ids, cum_weights=customer_weights)[0],
+                    status=self.random.choices(statuses, status_weights)[0],
+                    total_price=sum(price * quantity for _, price, quantity in lines),
+                    shipping_address='1 Main street',
+                    payment_method=self.random.choice(PAYMENT_METHODS),
+                    created_at=created_at,
+                    updated_at=created_at
+                ))
+                order_items.append(lines)
+                items_created += size
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_id=product_id, quantity=quantity, price=price, created_at=order.created_at)
+                    for order, lines in zip(orders, order_items)
+                    for product_id, price, quantity in lines
+                ], batch_size=self.chunk_size)
+            orders_created += len(orders)
+            if self.verbosity > 1:
+                self.stdout.write(f'Created {orders_created} orders, {items_created} order items...')
+        self.stdout.write(f'Created {orders_created} orders with {items_created} order items.')
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from api.models import DailySalesRollup, Order
+from api.rollup import rebuild_rollup, rollup_day
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup from raw orders, one chunk of days at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Number of days aggregated and written per transaction'
+        )
+
+    def handle(self, *args, **options):
+        chunk = timedelta(days=max(options['chunk_days'], 1))
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+
+        if bounds['first'] is None:
+            DailySalesRollup.objects.all().delete()
+            self.stdout.write('No orders found, rollup cleared.')
+            return
+
+        start = rollup_day(bounds['first'])
+        end = rollup_day(bounds['last']) + timedelta(days=1)
+        # Each chunk replaces its own days, only the rows outside every chunk are dropped up front
+        DailySalesRollup.objects.exclude(day__gte=start, day__lt=end).delete()
+        total = 0
+        while start < end:
+            chunk_end = min(start + chunk, end)
+            rows = rebuild_rollup(start, chunk_end)
+            total += rows
+            self.stdout.write(f'{start} to {chunk_end - timedelta(days=1)}: {rows} rows')
+            start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily sales rollup with {total} rows.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Product
+from api.tracking import reconcile_product_sales
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.units_sold and Product.revenue from order items and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of products checked per transaction'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True)
+
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            chunk = list(product_ids.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                repaired += reconcile_product_sales(chunk)
+            checked += len(chunk)
+            last_id = chunk[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, repaired {repaired}.'))
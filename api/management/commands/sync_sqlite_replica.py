@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into the SQLite replicas with the online backup API, '
+        'to try out replica routing locally (run with SQLITE_REPLICA=1)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and copy the database every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        source = connections['default']
+        if source.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite, replicate it with the server tools instead.')
+        targets = [
+            alias for alias in settings.DATABASE_REPLICAS or ['replica']
+            if alias in settings.DATABASES
+            and settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3'
+        ]
+        if not targets:
+            raise CommandError('No SQLite replica is configured.')
+
+        while True:
+            started = time.monotonic()
+            source.ensure_connection()
+            for alias in targets:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'], timeout=20)
+                try:
+                    # One step, so that readers of the replica never see a half-copied database
+                    source.connection.backup(target)
+                finally:
+                    target.close()
+            self.stdout.write(self.style.SUCCESS(
+                f"Copied the primary to {', '.join(targets)} in {time.monotonic() - started:.2f}s."
+            ))
+            if options['interval'] <= 0:
+                return
+            close_old_connections()
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollup(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderItem = apps.get_model('api', 'OrderItem')
+    DailySalesRollup = apps.get_model('api', 'DailySalesRollup')
+
+    totals = {}
+    order_rows = (
+        Order.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status')
+        .annotate(order_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    for row in order_rows:
+        totals[(row['day'], row['status'])] = DailySalesRollup(
+            day=row['day'],
+            status=row['status'],
+            order_count=row['order_count'],
+            revenue=row['revenue'] or 0
+        )
+    unit_rows = (
+        OrderItem.objects
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'order__status')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    for row in unit_rows:
+        totals[(row['day'], row['order__status'])].units = row['units'] or 0
+
+    rows = list(totals.values())
+    product_rows = (
+        OrderItem.objects
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id', 'order__status')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(ExpressionWrapper(
+                F('price') * F('quantity'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )),
+            order_count=Count('order_id', distinct=True)
+        )
+        .order_by()
+    )
+    for row in product_rows:
+        rows.append(DailySalesRollup(
+            day=row['day'],
+            product_id=row['product_id'],
+            status=row['order__status'],
+            units=row['units'] or 0,
+            revenue=row['revenue'] or 0,
+            order_count=row['order_count']
+        ))
+    DailySalesRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_productimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales rollups',
+                'constraints': [models.UniqueConstraint(fields=('day', 'product', 'status'), name='unique_daily_sales_per_product'), models.UniqueConstraint(condition=models.Q(('product__isnull', True)), fields=('day', 'status'), name='unique_daily_sales_total')],
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:38
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def populate_sales_counters(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    OrderItem = apps.get_model('api', 'OrderItem')
+    rows = (
+        OrderItem.objects
+        .exclude(order__status='cancelled')
+        .values('product_id')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(ExpressionWrapper(
+                F('price') * F('quantity'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            ))
+        )
+        .order_by()
+    )
+    products = []
+    for row in rows:
+        products.append(Product(id=row['product_id'], units_sold=row['units'], revenue=row['revenue']))
+    Product.objects.bulk_update(products, ['units_sold', 'revenue'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-units_sold'], name='api_product_units_sold_idx'),
+        ),
+        migrations.RunPython(populate_sales_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+
+def populate_primary_images(apps, schema_editor):
+    ProductImage = apps.get_model('api', 'ProductImage')
+    Product = apps.get_model('api', 'Product')
+    # Keep the oldest flagged image of each product
+    first_flagged = (
+        ProductImage.objects.filter(is_primary=True)
+        .values('product_id')
+        .annotate(first=Min('id'))
+        .values('first')
+    )
+    ProductImage.objects.filter(is_primary=True).exclude(id__in=first_flagged).update(is_primary=False)
+    Product.objects.update(primary_image=Subquery(
+        ProductImage.objects.filter(product_id=OuterRef('pk')).order_by('-is_primary', 'id').values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.productimage'),
+        ),
+        migrations.RunPython(populate_primary_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_primary', True)), fields=('product',), name='unique_primary_image'),
+        ),
+    ]
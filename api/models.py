@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 
 
 class Category(models.Model):
@@ -7,6 +10,12 @@ class Category(models.Model):
     description = models.TextField(blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='children')
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # SHA-256 of the image and paths of its renditions, maintained by api.images
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Materialized path of ancestor ids including this one, e.g. "1/4/9/"
+    path = models.CharField(max_length=255, editable=False, db_index=True, default='')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -16,6 +25,37 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'Categories'
 
+    def is_descendant_of(self, other):
+        return bool(other.path) and self.path.startswith(other.path)
+
+    def clean(self):
+        if self.pk and self.parent_id and (
+            self.parent_id == self.pk or self.parent.is_descendant_of(self)
+        ):
+            raise ValidationError({'parent': 'A category cannot be moved under itself or its descendants.'})
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        old_path, old_depth = Category.objects.filter(pk=self.pk).values_list('path', 'depth').get()
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.filter(
+                pk=self.parent_id
+            ).values_list('path', 'depth').get()
+            path, depth = f'{parent_path}{self.pk}/', parent_depth + 1
+        else:
+            path, depth = f'{self.pk}/', 0
+
+        if path != old_path:
+            with transaction.atomic():
+                Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+                if old_path:
+                    # Move the subtree along with this category
+                    Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                        path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                        depth=F('depth') + (depth - old_depth)
+                    )
+        self.path, self.depth = path, depth
+
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -25,22 +65,63 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # The flagged image, or the first one when none is, maintained by api.catalog
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='+'
+    )
+    # Sales counters over non-cancelled orders, maintained by api.tracking
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-units_sold'], name='api_product_units_sold_idx'),
+            models.Index(fields=['created_at', 'id'], name='api_product_created_id_idx'),
+            models.Index(fields=['category', 'is_active'], name='api_product_cat_active_idx'),
+            models.Index(fields=['price', 'id'], name='api_product_price_id_idx'),
+            models.Index(fields=['category', 'price'], name='api_product_cat_price_idx'),
+            models.Index(
+                fields=['price'],
+                condition=models.Q(is_active=True, stock__gt=0),
+                name='api_product_available_idx'
+            ),
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(is_active=True),
+                name='api_product_active_new_idx'
+            ),
+        ]
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # SHA-256 of the image and paths of its renditions, maintained by api.images
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'is_primary'], name='api_productimage_primary_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product'],
+                condition=models.Q(is_primary=True),
+                name='unique_primary_image'
+            ),
+        ]
+
 
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -73,6 +154,12 @@ class Order(models.Model):
     def __str__(self):
         return f"Order #{self.id} by {self.customer.user.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='api_order_created_id_idx'),
+            models.Index(fields=['status', 'created_at'], name='api_order_status_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -85,3 +172,28 @@ class OrderItem(models.Model):
         return f"{self.quantity} x {self.product.name} in Order #{self.order.id}"
 
 
+class DailySalesRollup(models.Model):
+    # Rows with an empty product hold the order-level totals for the day
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, blank=True, null=True, related_name='daily_sales')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.product or 'All products'} ({self.status})"
+
+    class Meta:
+        verbose_name_plural = 'Daily sales rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'product', 'status'],
+                name='unique_daily_sales_per_product'
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'status'],
+                condition=models.Q(product__isnull=True),
+                name='unique_daily_sales_total'
+            ),
+        ]
@@ -0,0 +1,113 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import seconds_since_last_write
+
+
+current_request = ContextVar('current_request', default=None)
+
+REPLICA_ACTIONS = ('list', 'retrieve')
+STICKY_COOKIE = 'read_primary'
+
+
+def view_reads_from_replica(match, method):
+    """Whether the view resolved in ``match`` may serve ``method`` from a replica."""
+    view = match.func
+    view_class = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if getattr(view_class, 'replica_reads', False):
+        # These responses are cached under the data version, recomputing them
+        # from a replica that has not caught up would cache stale figures
+        # under the new version
+        since_write = seconds_since_last_write()
+        return since_write is None or since_write > settings.READ_YOUR_WRITES_WINDOW
+    actions = getattr(view, 'actions', None) or {}
+    return actions.get(method.lower()) in REPLICA_ACTIONS
+
+
+def replica_for(request):
+    """
+    The replica alias ``request`` reads from, or None for the primary. Only
+    safe requests to replica-enabled views qualify, and not while the client
+    is within the read-your-writes window of its last write.
+    """
+    if request.resolver_match is None:
+        # Not routed yet (e.g. session or auth middleware); decide once the view is known
+        return None
+    if not hasattr(request, '_replica_alias'):
+        request._replica_alias = None
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            and view_reads_from_replica(request.resolver_match, request.method)
+        ):
+            request._replica_alias = random.choice(settings.DATABASE_REPLICAS)
+    return request._replica_alias
+
+
+class ReplicaRouter:
+    """
+    Send the reads of replica-enabled requests (see :func:`replica_for`) to
+    a replica and everything else, including all writes, to the primary.
+    Migrations only run on the primary; replicas are copies of it.
+    """
+
+    def db_for_read(self, model, **hints):
+        request = current_request.get()
+        return replica_for(request) if request is not None else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Expose the current request to :class:`ReplicaRouter` and pin clients
+    to the primary for READ_YOUR_WRITES_WINDOW seconds after they write, so
+    they never read older data than they just wrote.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.pin_writer(request, response)
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.pin_writer(request, response)
+
+    def pin_writer(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.READ_YOUR_WRITES_WINDOW,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,153 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import DailySalesRollup
+
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Number of buckets returned when a granularity is requested without a window
+DEFAULT_PERIODS = {
+    'day': 7,
+    'week': 4,
+    'month': 6,
+}
+
+MAX_BUCKETS = 1000
+
+CENTS = Decimal('0.01')
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def previous_period(start, granularity):
+    return period_start(start - timedelta(days=1), granularity)
+
+
+def periods(start, end, granularity):
+    """Yield the start of every period from ``start`` up to (not including) ``end``."""
+    current = period_start(start, granularity)
+    while current < end:
+        yield current
+        current = next_period(current, granularity)
+
+
+def format_bucket(start, granularity, revenue):
+    if granularity == 'week':
+        week_end = start + timedelta(days=6)
+        return {
+            'week': f"{start.strftime('%Y-%m-%d')} to {week_end.strftime('%Y-%m-%d')}",
+            'revenue': str(revenue)
+        }
+    if granularity == 'month':
+        return {
+            'month': start.strftime('%Y-%m'),
+            'revenue': str(revenue)
+        }
+    return {
+        'date': start.strftime('%Y-%m-%d'),
+        'revenue': str(revenue)
+    }
+
+
+def revenue_by_period(start, end, granularity='day'):
+    """
+    Sum order revenue per period for orders created between the ``start`` and
+    ``end`` dates (half-open), in a single grouped query over the order-level
+    rows of the daily sales rollup.
+    """
+    trunc = GRANULARITIES[granularity]
+    rows = (
+        DailySalesRollup.objects
+        .filter(product__isnull=True, day__gte=start, day__lt=end)
+        .annotate(period=trunc('day'))
+        .values('period')
+        .annotate(total=Sum('revenue'))
+        .order_by()
+    )
+    return {row['period']: row['total'].quantize(CENTS) for row in rows}
+
+
+def revenue_series(start, end, granularity):
+    """Return formatted buckets covering ``start``..``end`` (inclusive), newest first."""
+    start = period_start(start, granularity)
+    end = next_period(period_start(end, granularity), granularity)
+    totals = revenue_by_period(start, end, granularity)
+    return [
+        format_bucket(period, granularity, totals.get(period, 0))
+        for period in reversed(list(periods(start, end, granularity)))
+    ]
+
+
+def bucket_count(start, end, granularity):
+    count = 0
+    for _ in periods(start, end + timedelta(days=1), granularity):
+        count += 1
+        if count > MAX_BUCKETS:
+            break
+    return count
+
+
+def default_window(today, granularity):
+    start = period_start(today, granularity)
+    for _ in range(DEFAULT_PERIODS[granularity] - 1):
+        start = previous_period(start, granularity)
+    return start, today
+
+
+def revenue_overview(today):
+    """
+    Build the daily (7 days), weekly (4 weeks) and monthly (6 months) revenue
+    lists from one grouped query over the whole window, rolling days up into
+    weeks and months in Python.
+    """
+    day_from, _ = default_window(today, 'day')
+    week_from, _ = default_window(today, 'week')
+    month_from, _ = default_window(today, 'month')
+
+    start = min(day_from, week_from, month_from)
+    end = max(
+        next_period(today, 'day'),
+        next_period(period_start(today, 'week'), 'week'),
+        next_period(period_start(today, 'month'), 'month'),
+    )
+    daily = revenue_by_period(start, end, 'day')
+
+    weekly = defaultdict(int)
+    monthly = defaultdict(int)
+    for day, total in daily.items():
+        weekly[period_start(day, 'week')] += total
+        monthly[period_start(day, 'month')] += total
+
+    rolled_up = {'day': daily, 'week': weekly, 'month': monthly}
+    result = {}
+    for granularity, window_start in (('day', day_from), ('week', week_from), ('month', month_from)):
+        window_end = next_period(period_start(today, granularity), granularity)
+        totals = rolled_up[granularity]
+        result[granularity] = [
+            format_bucket(period, granularity, totals.get(period, 0))
+            for period in reversed(list(periods(window_start, window_end, granularity)))
+        ]
+    return result
@@ -0,0 +1,142 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .models import DailySalesRollup, Order, OrderItem
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup_day(created_at):
+    return timezone.localdate(created_at)
+
+
+def line_total():
+    """Order item revenue: unit price times quantity."""
+    return ExpressionWrapper(
+        F('price') * F('quantity'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def aggregate_rollup(start, end):
+    """
+    Aggregate raw orders created between the ``start`` and ``end`` days
+    (half-open) into unsaved DailySalesRollup rows.
+    """
+    orders = Order.objects.filter(created_at__gte=day_start(start), created_at__lt=day_start(end))
+    items = OrderItem.objects.filter(
+        order__created_at__gte=day_start(start),
+        order__created_at__lt=day_start(end)
+    )
+
+    totals = {}
+    order_rows = (
+        orders
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status')
+        .annotate(order_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    for row in order_rows:
+        totals[(row['day'], row['status'])] = DailySalesRollup(
+            day=row['day'],
+            status=row['status'],
+            order_count=row['order_count'],
+            revenue=row['revenue'] or 0
+        )
+
+    unit_rows = (
+        items
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'order__status')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    for row in unit_rows:
+        totals[(row['day'], row['order__status'])].units = row['units'] or 0
+
+    product_rows = (
+        items
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id', 'order__status')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(line_total()),
+            order_count=Count('order_id', distinct=True)
+        )
+        .order_by()
+    )
+    rows = list(totals.values())
+    for row in product_rows:
+        rows.append(DailySalesRollup(
+            day=row['day'],
+            product_id=row['product_id'],
+            status=row['order__status'],
+            units=row['units'] or 0,
+            revenue=row['revenue'] or 0,
+            order_count=row['order_count']
+        ))
+    return rows
+
+
+def rollup_key_order(key):
+    day, product_id, status = key
+    return day, product_id or 0, status
+
+
+@transaction.atomic
+def apply_rollup_delta(deltas):
+    """
+    Add ``deltas``, ``{(day, product_id, status): [order_count, units, revenue]}``
+    with an empty product for the order-level rows, to the rollup rows.
+
+    Rows are updated in key order so concurrent writers lock them in the same
+    order. A missing row is inserted empty first, skipping the insert when a
+    concurrent writer got there first, and rows left without orders are
+    removed; the update is retried until it finds the row.
+    """
+    changed = False
+    for key in sorted(deltas, key=rollup_key_order):
+        order_count, units, revenue = deltas[key]
+        if not (order_count or units or revenue):
+            continue
+        day, product_id, status = key
+        rows = DailySalesRollup.objects.filter(day=day, product_id=product_id, status=status)
+        changes = {
+            'order_count': F('order_count') + order_count,
+            'units': F('units') + units,
+            'revenue': F('revenue') + revenue,
+        }
+        while not rows.update(**changes):
+            DailySalesRollup.objects.bulk_create(
+                [DailySalesRollup(day=day, product_id=product_id, status=status)], ignore_conflicts=True
+            )
+        if order_count < 0:
+            rows.filter(order_count=0).delete()
+        changed = True
+    if changed:
+        transaction.on_commit(bump_data_version)
+
+
+@transaction.atomic
+def rebuild_rollup(start, end):
+    """
+    Replace every rollup row between the ``start`` and ``end`` days
+    (half-open) in one transaction, so readers see either the old or the
+    new rows. The old rows are locked first: order writers that touch them
+    wait for the swap and then apply their change to the new rows.
+    """
+    existing = DailySalesRollup.objects.filter(day__gte=start, day__lt=end)
+    list(existing.select_for_update().values_list('pk', flat=True))
+    rows = aggregate_rollup(start, end)
+    existing.delete()
+    DailySalesRollup.objects.bulk_create(rows, batch_size=1000)
+    transaction.on_commit(bump_data_version)
+    return len(rows)
@@ -0,0 +1,153 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def query_terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+    """
+    Interface of a product search index. Backends keep their own index in
+    sync through :meth:`update` and :meth:`remove` and answer queries with
+    ranked product ids.
+    """
+
+    def setup(self):
+        """Create whatever storage the index needs. Safe to call repeatedly."""
+
+    def update(self, products):
+        """Add or refresh ``products`` (with ``category`` loaded) in the index."""
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def matching(self, query):
+        """Return a Q object restricting a Product queryset to matches of ``query``."""
+        raise NotImplementedError
+
+    def ranked_ids(self, query, limit, offset=0):
+        """Return the ids of the best matches for ``query``, best first."""
+        raise NotImplementedError
+
+    def count(self, query):
+        return Product.objects.filter(self.matching(query)).count()
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index keyed by product id, with prefix indexes so that
+    ``term*`` lookups stay index-only. Name matches rank above category and
+    description matches.
+    """
+    table = 'api_product_fts'
+    weights = (10.0, 1.0, 3.0)
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "name, description, category, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+
+    def update(self, products):
+        products = list(products)
+        if not products:
+            return
+        self.remove([product.id for product in products])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+                [(product.id, product.name, product.description, product.category.name) for product in products]
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", product_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def match_expression(self, query):
+        # Every term must match, the last one (still being typed) as a prefix
+        terms = [f'"{term}"' for term in query_terms(query)]
+        if terms:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    def matching(self, query):
+        return Q(id__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+            [self.match_expression(query)]
+        ))
+
+    def ranked_ids(self, query, limit, offset=0):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s",
+                [self.match_expression(query), limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Index-less fallback for databases without a dedicated backend: matches
+    every term as a substring of the name, description or category name and
+    ranks name matches first.
+    """
+
+    def update(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def matching(self, query):
+        condition = Q()
+        for term in query_terms(query):
+            condition &= (
+                Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+            )
+        return condition
+
+    def ranked_ids(self, query, limit, offset=0):
+        terms = query_terms(query)
+        name_hits = Value(0)
+        for term in terms:
+            name_hits = name_hits + Case(When(name__icontains=term, then=Value(1)), default=Value(0))
+        return list(
+            Product.objects.filter(self.matching(query))
+            .annotate(name_hits=name_hits)
+            .order_by('-name_hits', 'id')
+            .values_list('id', flat=True)[offset:offset + limit]
+        )
+
+
+def get_search_backend():
+    return import_string(settings.PRODUCT_SEARCH_BACKEND)()
+
@@ -1,6 +1,192 @@
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import FileField, Prefetch
 from .models import Category, Product, ProductImage, Customer, Order, OrderItem
+from .catalog import category_summary, refresh_primary_image, unflag_primary_images
+from .images import rendition_urls, schedule_renditions
+from .inventory import InsufficientStock, lock_products, order_quantities, reserve_stock
+from .tracking import order_written, orders_created, snapshot_order
+
+
+def bulk_write_children(model, parent_field, parent, existing, children_data):
+    """
+    Write nested children of ``parent`` in bulk. Entries carrying the id of one
+    of the ``existing`` children update it, the others are created, and existing
+    children that are not mentioned are deleted. Returns the created and
+    updated children.
+    """
+    to_create, to_update, to_save, updated_fields = [], [], [], set()
+    file_fields = {field.name for field in model._meta.concrete_fields if isinstance(field, FileField)}
+    existing = dict(existing)
+    for child_data in children_data:
+        child = existing.pop(child_data.pop('id', None), None)
+        if child is None:
+            to_create.append(model(**{parent_field: parent}, **child_data))
+            continue
+        for attr, value in child_data.items():
+            setattr(child, attr, value)
+        if file_fields & child_data.keys():
+            # bulk_update skips FileField.pre_save, which stores the upload, and the save signals
+            to_save.append(child)
+            continue
+        updated_fields.update(child_data)
+        to_update.append(child)
+
+    if to_create:
+        model.objects.bulk_create(to_create)
+    if to_update and updated_fields:
+        model.objects.bulk_update(to_update, sorted(updated_fields))
+    for child in to_save:
+        child.save()
+    if existing:
+        model.objects.filter(id__in=existing).delete()
+    return to_create + to_update + to_save
+
+
+def validate_children(list_serializer, children_data, existing):
+    """
+    Check nested ``children_data`` before :func:`bulk_write_children` writes
+    them: ids must be those of the ``existing`` children (a queryset, None
+    when the parent is being created) and new children need every required
+    field, which partial updates do not enforce. Raises the errors per child.
+    """
+    ids = {child['id'] for child in children_data if child.get('id') is not None}
+    known = set()
+    if ids and existing is not None:
+        known = set(existing.filter(id__in=ids).values_list('id', flat=True))
+    required = [name for name, field in list_serializer.child.fields.items() if field.required]
+
+    errors = []
+    for child in children_data:
+        if child.get('id') is not None:
+            errors.append({} if child['id'] in known else {
+                'id': [f'Invalid pk "{child["id"]}" - object does not exist.']
+            })
+        else:
+            errors.append({name: ['This field is required.'] for name in required if name not in child})
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves primary keys from ``context['related_objects'][model]`` when the
+    caller preloaded them, and falls back to a query otherwise.
+    """
+
+    def to_internal_value(self, data):
+        cache = self.context.get('related_objects', {}).get(self.get_queryset().model)
+        if cache and not isinstance(data, bool):
+            try:
+                return cache[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+def parse_field_list(params, name):
+    return {value.strip() for value in params.get(name, '').split(',') if value.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for reads: ``?fields=id,name,price`` limits the
+    top-level representation to the named fields and ``?expand=`` adds
+    nested collections (:attr:`expandable_fields`) to it, e.g.
+    ``?fields=id,total_price&expand=items``. Without ``fields`` the full
+    representation is returned. Writes always use every field.
+    """
+    expandable_fields = ()
+    # ORM paths read by fields that have no model source (method fields)
+    field_sources = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = self.sparse_field_names(fields)
+        if names is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in names}
+
+    def sparse_field_names(self, fields=None):
+        """The requested top-level fields, or None for the full representation."""
+        request = self.context.get('request')
+        parent = self.parent
+        is_root = parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+        if request is None or not is_root or request.method not in SAFE_METHODS:
+            return None
+
+        requested = parse_field_list(request.query_params, 'fields')
+        expand = parse_field_list(request.query_params, 'expand')
+        if not requested:
+            if expand - set(self.expandable_fields):
+                raise ParseError(f"Invalid expand, expected one of: {', '.join(self.expandable_fields)}")
+            return None
+        available = set(fields if fields is not None else self.fields)
+        unknown = requested - available
+        if unknown:
+            raise ParseError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if expand - set(self.expandable_fields):
+            raise ParseError(f"Invalid expand, expected one of: {', '.join(self.expandable_fields)}")
+        return requested | expand
+
+
+def sparse_queryset(queryset, serializer, names, always=()):
+    """
+    Trim ``queryset`` to what the ``names`` fields of ``serializer`` read:
+    only their columns (plus the ``always`` ones), joins for the relations
+    they follow and prefetches for the nested collections. Columns are not
+    trimmed when a field reads something that is not a model field.
+    """
+    model = queryset.model
+    only = {model._meta.pk.name, *(name for name in always if hasattr(model, name))}
+    select_related, prefetches = set(), []
+    trim_columns = True
+
+    def add_path(path, whole_object=False):
+        current, parts = model, path.split('__')
+        for position, part in enumerate(parts):
+            try:
+                model_field = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                return False
+            last = position == len(parts) - 1
+            if (model_field.many_to_one or model_field.one_to_one) and model_field.concrete:
+                if last and not whole_object:
+                    break
+                select_related.add('__'.join(parts[:position + 1]))
+                current = model_field.related_model
+            elif model_field.is_relation or not last:
+                return False
+        only.add(path)
+        return True
+
+    for name in names:
+        field = serializer.fields[name]
+        if name in serializer.field_sources:
+            paths = [(path, False) for path in serializer.field_sources[name]]
+        elif isinstance(field, serializers.ListSerializer):
+            related_model = model._meta.get_field(field.source).related_model
+            related = related_model._default_manager.all()
+            loader = getattr(field.child, 'setup_eager_loading', None)
+            prefetches.append(Prefetch(field.source, queryset=loader(related) if loader else related))
+            continue
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            paths = [('__'.join(field.source_attrs), False)]
+        elif isinstance(field, serializers.SlugRelatedField):
+            paths = [('__'.join(field.source_attrs + [field.slug_field]), False)]
+        else:
+            # Other related fields (StringRelatedField, ...) need the whole object
+            paths = [('__'.join(field.source_attrs), isinstance(field, serializers.RelatedField))]
+        for path, whole_object in paths:
+            trim_columns &= add_path(path, whole_object)
+
+    queryset = queryset.select_related(*select_related) if select_related else queryset.select_related(None)
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+    return queryset.defer(None).only(*only) if trim_columns else queryset.defer(None)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,22 +196,56 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # Writable so nested product updates can address existing images
+    id = serializers.IntegerField(required=False)
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'image', 'renditions', 'is_primary', 'created_at']
+        read_only_fields = ['created_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.order_by('id')
 
-class CategorySerializer(serializers.ModelSerializer):
+    def get_renditions(self, obj):
+        return rendition_urls(obj.renditions, self.context.get('request'))
+
+    def create(self, validated_data):
+        validated_data.pop('id', None)
+        return super().create(validated_data)
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     parent_name = serializers.StringRelatedField(source='parent', read_only=True)
+    renditions = serializers.SerializerMethodField()
+
+    field_sources = {'renditions': ['renditions']}
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description', 'parent', 'parent_name', 'image', 'created_at', 'updated_at']
+        fields = [
+            'id', 'name', 'description', 'parent', 'parent_name', 'image', 'renditions', 'created_at', 'updated_at'
+        ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_renditions(self, obj):
+        return rendition_urls(obj.renditions, self.context.get('request'))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('parent')
+
+    def validate_parent(self, parent):
+        if self.instance and parent and (
+            parent.pk == self.instance.pk or parent.is_descendant_of(self.instance)
+        ):
+            raise serializers.ValidationError('A category cannot be moved under itself or its descendants.')
+        return parent
 
-class ProductSerializer(serializers.ModelSerializer):
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.StringRelatedField(source='category', read_only=True)
     category_by_name = serializers.SlugRelatedField(
         slug_field='name',
@@ -34,76 +254,162 @@ class ProductSerializer(serializers.ModelSerializer):
     )
     images = ProductImageSerializer(many=True, required=False)
 
+    expandable_fields = ('images',)
+
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'discount_price',
-            'category', 'category_name', 'category_by_name', 'images',
+            'category', 'category_name', 'category_by_name', 'images', 'primary_image',
             'stock', 'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('category').prefetch_related(
+            Prefetch('images', queryset=ProductImageSerializer.setup_eager_loading(ProductImage.objects.all()))
+        )
+
+    def validate_images(self, images):
+        if sum(1 for image in images if image.get('is_primary')) > 1:
+            raise serializers.ValidationError('Only one image can be primary.')
+        validate_children(self.fields['images'], images, self.instance.images.all() if self.instance else None)
+        return images
+
+    @transaction.atomic
     def create(self, validated_data):
         images_data = validated_data.pop('images', [])
         product = Product.objects.create(**validated_data)
-        for image_data in images_data:
-            ProductImage.objects.create(product=product, **image_data)
+        schedule_renditions(bulk_write_children(ProductImage, 'product', product, {}, images_data))
+        product.primary_image_id = refresh_primary_image(product.pk)
         return product
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        images_data = validated_data.pop('images', [])
+        images_data = validated_data.pop('images', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        existing_images = {image.id: image for image in instance.images.all()}
-        for image_data in images_data:
-            image_id = image_data.get('id', None)
-            if image_id and image_id in existing_images:
-                image = existing_images.pop(image_id)
-                for attr, value in image_data.items():
-                    setattr(image, attr, value)
-                image.save()
-            else:
-                ProductImage.objects.create(product=instance, **image_data)
-        for image in existing_images.values():
-            image.delete()
+        if images_data is not None:
+            if any(image.get('is_primary') for image in images_data):
+                # Bulk writes bypass the signal that moves the flag, clear it up front
+                unflag_primary_images(instance.pk)
+            existing_images = {image.id: image for image in instance.images.all()}
+            schedule_renditions(
+                bulk_write_children(ProductImage, 'product', instance, existing_images, images_data)
+            )
+            instance.primary_image_id = refresh_primary_image(instance.pk)
         return instance
 
 
+class ProductLeanSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact product representation for ``?lean=true`` lists: no nested images
+    or category names, just the list-size rendition of the primary image.
+    """
+    primary_image = serializers.SerializerMethodField()
+
+    field_sources = {'primary_image': ['primary_image__image', 'primary_image__renditions']}
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'discount_price', 'category', 'primary_image', 'stock', 'is_active']
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('primary_image').only(
+            'id', 'name', 'price', 'discount_price', 'category', 'stock', 'is_active', 'created_at',
+            'primary_image__image', 'primary_image__renditions'
+        )
+
+    def get_primary_image(self, obj):
+        image = obj.primary_image
+        if image is None:
+            return None
+        request = self.context.get('request')
+        rendition = rendition_urls(image.renditions, request).get('list')
+        if rendition:
+            return {'id': image.id, 'url': rendition['jpeg'], 'webp': rendition['webp']}
+        # The renditions do not exist yet, fall back to the original upload
+        url = image.image.url if image.image else None
+        if url and request is not None:
+            url = request.build_absolute_uri(url)
+        return {'id': image.id, 'url': url, 'webp': None}
+
+
 class CategoryDetailSerializer(CategorySerializer):
     products_info = serializers.SerializerMethodField()
 
+    field_sources = dict(CategorySerializer.field_sources, products_info=[])
+
     class Meta(CategorySerializer.Meta):
         fields = CategorySerializer.Meta.fields + ['products_info']
 
     def get_products_info(self, obj):
-        products = obj.products.all()
-        return {
-            'count': products.count(),
-            'products': [
-                {
-                    'id': product.id,
-                    'name': product.name,
-                    'price': product.price
-                }
-                for product in products[:5]
-            ]
-        }
+        summaries = self.context.get('category_summaries')
+        if summaries is not None:
+            return summaries[obj.id]
+        return category_summary(obj.id)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
+    # Writable so nested order updates can address existing items
+    id = serializers.IntegerField(required=False)
     product_name = serializers.StringRelatedField(source='product', read_only=True)
 
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'product_name', 'quantity', 'price', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['created_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('product').order_by('id')
+
+
+class OrderListSerializer(serializers.ListSerializer):
+    @transaction.atomic
+    def create(self, validated_data):
+        """
+        Bulk insert the orders of ``validated_data``. Stock is reserved order
+        by order first; orders that cannot get their stock are skipped and
+        their shortages left in :attr:`conflicts`, keyed by position.
+        """
+        self.conflicts = {}
+        lock_products({
+            item['product'].pk for order_data in validated_data for item in order_data['items']
+        })
+        orders, items = [], []
+        for position, order_data in enumerate(validated_data):
+            if order_data.get('status') != 'cancelled':
+                try:
+                    reserve_stock(order_quantities(order_data['items']))
+                except InsufficientStock as exc:
+                    self.conflicts[position] = exc.shortages
+                    continue
+            items_data = order_data.pop('items')
+            order = Order(**order_data)
+            orders.append(order)
+            for item_data in items_data:
+                item_data.pop('id', None)
+                items.append(OrderItem(order=order, **item_data))
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create(items)
+        orders_created(orders, items)
+        return orders
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
     customer_username = serializers.StringRelatedField(source='customer.user.username', read_only=True)
     items = OrderItemSerializer(many=True)
 
+    expandable_fields = ('items',)
+
     class Meta:
         model = Order
         fields = [
@@ -111,37 +417,64 @@ class OrderSerializer(serializers.ModelSerializer):
             'shipping_address', 'payment_method', 'items', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        list_serializer_class = OrderListSerializer
+
+    def validate_items(self, items):
+        validate_children(self.fields['items'], items, self.instance.items.all() if self.instance else None)
+        return items
+
+    @staticmethod
+    def prefetch_related_objects(records):
+        """
+        Load the customers and products referenced by raw order payloads in two
+        queries, for use as the ``related_objects`` serializer context.
+        """
+        customer_ids, product_ids = set(), set()
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            customer_ids.add(record.get('customer'))
+            items = record.get('items')
+            if isinstance(items, list):
+                product_ids.update(item.get('product') for item in items if isinstance(item, dict))
 
+        def valid_ids(values):
+            return [value for value in values if isinstance(value, int) and not isinstance(value, bool)]
+
+        return {
+            Customer: Customer.objects.in_bulk(valid_ids(customer_ids)),
+            Product: Product.objects.in_bulk(valid_ids(product_ids)),
+        }
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('customer__user').prefetch_related(
+            Prefetch('items', queryset=OrderItemSerializer.setup_eager_loading(OrderItem.objects.all()))
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         order = Order.objects.create(**validated_data)
-
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        bulk_write_children(OrderItem, 'order', order, {}, items_data)
+        order_written(order)
         return order
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        items_data = validated_data.pop('items', [])
+        items_data = validated_data.pop('items', None)
+        before = snapshot_order(instance)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        existing_items = {item.id: item for item in instance.items.all()}
-        for item_data in items_data:
-            item_id = item_data.get('id', None)
-            if item_id and item_id in existing_items:
-                # Update existing item
-                item = existing_items.pop(item_id)
-                for attr, value in item_data.items():
-                    setattr(item, attr, value)
-                item.save()
-            else:
-                OrderItem.objects.create(order=instance, **item_data)
-        for item in existing_items.values():
-            item.delete()
+        if items_data is not None:
+            existing_items = {item.id: item for item in instance.items.all()}
+            bulk_write_children(OrderItem, 'order', instance, existing_items, items_data)
+        order_written(instance, before)
         return instance
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
 
@@ -149,3 +482,7 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id', 'user', 'username', 'email', 'phone', 'address', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user')
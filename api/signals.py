@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_data_version, mark_catalog_changed
+from .catalog import invalidate_category_summaries, refresh_primary_image, unflag_primary_images
+from .images import schedule_renditions
+from .search import get_search_backend
+from .tracking import order_deleted, snapshot_order
+from .models import Category, Customer, Order, OrderItem, Product, ProductImage
+
+
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Customer)
+def data_changed(sender, **kwargs):
+    transaction.on_commit(bump_data_version)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_order_sales(sender, instance, **kwargs):
+    # Also runs for orders deleted along with their customer, whose items are still there
+    instance._sales_snapshot = snapshot_order(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_removed(sender, instance, **kwargs):
+    order_deleted(instance._sales_snapshot)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImage)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(mark_catalog_changed)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Children were detached by SET_NULL, so their subtrees become roots
+    if instance.path:
+        Category.objects.filter(path__startswith=instance.path).update(
+            path=Substr('path', len(instance.path) + 1),
+            depth=F('depth') - instance.depth - 1
+        )
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_category_changed(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)}
+    transaction.on_commit(lambda: invalidate_category_summaries(category_ids))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().update([instance]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().remove([instance.pk]))
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_name(sender, instance, **kwargs):
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = Category.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    # The category name is indexed with each of its products
+    if not created and instance.name != getattr(instance, '_previous_name', instance.name):
+        transaction.on_commit(
+            lambda: get_search_backend().update(instance.products.select_related('category'))
+        )
+
+
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Category)
+def remember_image_upload(sender, instance, **kwargs):
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+    if instance._image_uploaded:
+        # The renditions of a replaced image are stale until the new ones exist
+        instance.image_hash, instance.renditions = '', {}
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+def image_uploaded(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        schedule_renditions([instance])
+
+
+@receiver(pre_save, sender=ProductImage)
+def flag_primary_image(sender, instance, **kwargs):
+    # Only one image per product may be flagged (unique_primary_image)
+    if instance.is_primary:
+        unflag_primary_images(instance.product_id, exclude=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_images_changed(sender, instance, origin=None, **kwargs):
+    # Nothing to maintain when the images go because their product is deleted
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+    refresh_primary_image(instance.product_id)
@@ -1,3 +1,1313 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from base64 import urlsafe_b64encode
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+
+from .analytics import AnalyticsSnapshot, build_snapshot
+from .async_views import AsyncDashboardStatsView, AsyncRevenueStatsView
+from .catalog import category_summary, empty_summary
+from .fast_serialization import SerializerPlan
+from .images import create_renditions, process_image
+from .instrumentation import registry
+from .replicas import STICKY_COOKIE
+from .models import Category, Product, ProductImage, Customer, Order, OrderItem, DailySalesRollup
+from .rollup import day_start, rebuild_rollup
+from .serializers import OrderSerializer, ProductSerializer
+from .tracking import reconcile_product_sales
+from .views import OrderViewSet
+
+
+class QueryCountMixin:
+    def assertQueryCount(self, url, expected):
+        """Fetch ``url`` and assert it ran exactly ``expected`` queries."""
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class ApiTestCase(QueryCountMixin, APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+        self.category = Category.objects.create(name='Phones')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}',
+                description='Description',
+                price=Decimal('10.00') + i,
+                category=self.category,
+                stock=100
+            )
+            for i in range(3)
+        ]
+        self.customer = Customer.objects.create(user=User.objects.create(username='alice'))
+
+    def order_payload(self, products=None, quantity=1):
+        products = products or self.products
+        return {
+            'customer': self.customer.id,
+            'total_price': '30.00',
+            'shipping_address': 'Main street 1',
+            'payment_method': 'card',
+            'items': [
+                {'product': product.id, 'quantity': quantity, 'price': str(product.price)}
+                for product in products
+            ]
+        }
+
+    def create_orders(self, count):
+        for _ in range(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/orders/', self.order_payload(), format='json')
+            self.assertEqual(response.status_code, 201)
+
+
+class EagerLoadingTests(ApiTestCase):
+    def assertQueryCountIndependentOfSize(self, url, expected):
+        self.create_orders(1)
+        self.assertQueryCount(url, expected)
+        self.create_orders(9)
+        self.assertQueryCount(url, expected)
+
+    def test_order_list(self):
+        self.assertQueryCountIndependentOfSize('/api/orders/', 3)
+
+    def test_customer_orders(self):
+        self.assertQueryCountIndependentOfSize(f'/api/customers/{self.customer.id}/orders/', 3)
+
+    def test_dashboard_stats(self):
+        self.assertQueryCountIndependentOfSize('/api/dashboard/stats/', 7)
+
+    def test_product_list(self):
+        self.assertQueryCountIndependentOfSize('/api/products/', 3)
+
+    def test_sparse_fieldsets(self):
+        response = self.assertQueryCount('/api/products/?fields=id,name,price', 2)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+
+        self.create_orders(2)
+        response = self.assertQueryCount('/api/orders/?fields=id,customer_username&expand=items', 3)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'customer_username', 'items'})
+
+        self.assertEqual(self.client.get('/api/customers/?fields=id,password').status_code, 400)
+
+
+class FastListSerializationTests(ApiTestCase):
+    def test_same_output_as_serializers(self):
+        self.products[0].discount_price = Decimal('8.50')
+        self.products[0].save()
+        ProductImage.objects.create(product=self.products[0], image='products/a.png', renditions={
+            'thumbnail': {'webp': 'renditions/ab/thumbnail.webp', 'jpeg': 'renditions/ab/thumbnail.jpeg'}
+        })
+        ProductImage.objects.create(product=self.products[0], image='products/b.png', is_primary=True)
+        ProductImage.objects.create(product=self.products[1])
+        self.create_orders(3)
+        self.client.patch(f'/api/orders/{Order.objects.first().id}/status/', {'status': 'shipped'}, format='json')
+
+        for url in ['/api/products/', '/api/products/?ordering=-price&page_size=2&page=2', '/api/orders/']:
+            fast = self.client.get(url)
+            with override_settings(FAST_LIST_SERIALIZATION=False):
+                expected = self.client.get(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, expected.content)
+
+
+class DashboardCacheTests(ApiTestCase):
+    def test_served_from_cache_until_data_changes(self):
+        self.create_orders(1)
+        first = self.assertQueryCount('/api/dashboard/stats/', 7)
+        self.assertQueryCount('/api/dashboard/stats/', 0)
+
+        response = self.client.get('/api/dashboard/stats/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.create_orders(1)
+        response = self.assertQueryCount('/api/dashboard/stats/', 7)
+        self.assertEqual(response.data['total_orders'], 2)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_revenue_is_cached_per_day(self):
+        today = timezone.localdate()
+        self.assertEqual(self.client.get('/api/dashboard/revenue/').data['daily'][0]['date'], today.isoformat())
+        self.assertQueryCount('/api/dashboard/revenue/', 0)
+
+        tomorrow = today + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            response = self.client.get('/api/dashboard/revenue/')
+        self.assertEqual(response.data['daily'][0]['date'], tomorrow.isoformat())
+
+
+class GenerateDataTests(APITestCase):
+    def test_generated_data_is_consistent(self):
+        call_command(
+            'generate_data', categories=30, products=100, customers=20, items=500, chunk_size=40,
+            stdout=StringIO()
+        )
+        self.assertEqual(Product.objects.count(), 100)
+        self.assertEqual(Customer.objects.count(), 20)
+        self.assertEqual(OrderItem.objects.count(), 500)
+        self.assertGreater(Category.objects.filter(depth__gte=3).count(), 0)
+        for category in Category.objects.select_related('parent'):
+            self.assertEqual(category.path, f'{category.parent.path if category.parent else ""}{category.id}/')
+
+        # Derived data was rebuilt: counters match the order items and the rollup covers every order
+        self.assertEqual(reconcile_product_sales(Product.objects.values_list('id', flat=True)), 0)
+        self.assertEqual(
+            DailySalesRollup.objects.filter(product__isnull=True).aggregate(total=Sum('order_count'))['total'],
+            Order.objects.count()
+        )
+
+
+class InstrumentationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        self.create_orders(2)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/orders/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="3 queries, 0 duplicates"')
+        self.assertRegex(response['Server-Timing'], r'serializer;dur=[\d.]+')
+
+        metrics = self.client.get('/api/_metrics/')
+        self.assertTrue(metrics['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = metrics.content.decode()
+        self.assertIn('api_requests_total{view="order-list",method="GET",status="200"} 1', body)
+        self.assertIn('api_db_queries_total{view="order-list",method="GET"} 3', body)
+        self.assertIn('api_request_duration_seconds_count{view="order-list",method="GET"} 1', body)
+
+    def test_serializer_time_covers_fast_and_regular_paths(self):
+        def slowed(function):
+            def wrapper(*args, **kwargs):
+                time.sleep(0.01)
+                return function(*args, **kwargs)
+            return wrapper
+
+        def serializer_ms(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return float(re.search(r'serializer;dur=([\d.]+)', response['Server-Timing']).group(1))
+
+        with mock.patch.object(SerializerPlan, 'represent', slowed(SerializerPlan.represent)):
+            self.assertGreaterEqual(serializer_ms('/api/orders/'), 10)
+        order = Order.objects.first()
+        with mock.patch.object(OrderSerializer, 'to_representation', slowed(OrderSerializer.to_representation)):
+            self.assertGreaterEqual(serializer_ms(f'/api/orders/{order.id}/'), 10)
+            self.assertGreaterEqual(serializer_ms(f'/api/customers/{self.customer.id}/orders/'), 20)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log_names_the_caller(self):
+        with self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            self.client.get('/api/dashboard/top-customers/')
+        self.assertTrue(any('api/dashboard.py' in line for line in logs.output))
+
+
+class AnalyticsSnapshotTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_orders(3)
+        other = Customer.objects.create(user=User.objects.create(username='bob'))
+        self.client.post('/api/orders/', dict(self.order_payload(self.products[:1]), customer=other.id), format='json')
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'analytics.snapshot')
+
+    def test_dashboard_answers_from_fresh_snapshot(self):
+        expected = {
+            url: self.client.get(url).data
+            for url in ('/api/dashboard/top-customers/', '/api/dashboard/stats/')
+        }
+        build_snapshot(self.path)
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+
+        with override_settings(ANALYTICS_SNAPSHOT_PATH=self.path):
+            response = self.assertQueryCount('/api/dashboard/top-customers/', 1)
+            self.assertEqual(response.data, expected['/api/dashboard/top-customers/'])
+            response = self.assertQueryCount('/api/dashboard/stats/', 5)
+            self.assertEqual(response.data['total_orders'], expected['/api/dashboard/stats/']['total_orders'])
+            self.assertEqual(
+                Decimal(response.data['total_revenue']),
+                Decimal(expected['/api/dashboard/stats/']['total_revenue'])
+            )
+
+    def test_writes_after_the_build_are_not_cached_as_current(self):
+        build_snapshot(self.path)
+        with override_settings(ANALYTICS_SNAPSHOT_PATH=self.path):
+            self.assertEqual(self.client.get('/api/dashboard/stats/').data['total_orders'], 4)
+            self.create_orders(1)
+            self.assertEqual(self.client.get('/api/dashboard/stats/').data['total_orders'], 5)
+            # Rebuilding does not bump the data version, so the cached figures must already be right
+            build_snapshot(self.path)
+            self.assertEqual(self.client.get('/api/dashboard/stats/').data['total_orders'], 5)
+
+    def test_columns_are_streamed_in_chunks(self):
+        Order.objects.filter(pk=Order.objects.order_by('id')[0].pk).update(status='cancelled')
+        with mock.patch('api.analytics.CHUNK_SIZE', 2):
+            self.assertEqual(build_snapshot(self.path), {'orders': 4, 'items': 10})
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['analytics.snapshot'])
+
+        snapshot = AnalyticsSnapshot(self.path)
+        order_ids = Order.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(list(snapshot.columns['orders.order']), list(order_ids))
+        self.assertEqual(snapshot.total('items', 'quantity'), 10)
+        alice, bob = self.customer.id, Customer.objects.get(user__username='bob').id
+        self.assertEqual(snapshot.sum_by('orders', 'customer'), {alice: 3, bob: 1})
+        self.assertEqual(snapshot.sum_by('orders', 'customer', exclude_statuses=['cancelled']), {alice: 2, bob: 1})
+        self.assertEqual(
+            snapshot.sum_by('orders', 'customer', 'total', exclude_statuses=['cancelled']), {alice: 6000, bob: 3000}
+        )
+        self.assertEqual(snapshot.top(snapshot.sum_by('items', 'product', 'quantity'), 1), [(self.products[0].id, 4)])
+
+    def test_stale_snapshot_is_ignored(self):
+        build_snapshot(self.path)
+        with override_settings(ANALYTICS_SNAPSHOT_PATH=self.path, ANALYTICS_SNAPSHOT_MAX_AGE=-1):
+            self.assertQueryCount('/api/dashboard/top-customers/', 1)
+
+
+class ImageRenditionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name, IMAGE_RENDITION_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def png(self, color=(200, 30, 30, 128)):
+        output = io.BytesIO()
+        Image.new('RGBA', (1600, 800), color).save(output, format='PNG')
+        return output.getvalue()
+
+    def upload(self, product):
+        upload = SimpleUploadedFile('photo.png', self.png(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/products/{product.id}/images/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return ProductImage.objects.get(pk=response.data['id'])
+
+    def test_renditions_created_and_deduplicated(self):
+        first = self.upload(self.products[0])
+        second = self.upload(self.products[1])
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.renditions, first.renditions)
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'products'))), 1)
+
+        with default_storage.open(first.renditions['list']['webp']) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (400, 200))
+
+        response = self.client.get(f'/api/products/{self.products[0].id}/')
+        renditions = response.data['images'][0]['renditions']
+        self.assertEqual(set(renditions), {'thumbnail', 'list', 'detail'})
+        self.assertTrue(renditions['thumbnail']['jpeg'].endswith('/thumbnail.jpeg'))
+
+    def test_nested_update_stores_new_upload(self):
+        image = self.upload(self.products[0])
+        upload = SimpleUploadedFile('new.png', self.png((30, 30, 200, 255)), content_type='image/png')
+        serializer = ProductSerializer(
+            self.products[0], data={'images': [{'id': image.id, 'image': upload}]}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+
+        replaced = ProductImage.objects.get(pk=image.pk)
+        self.assertNotEqual(replaced.image.name, image.image.name)
+        self.assertTrue(default_storage.exists(replaced.image.name))
+        self.assertNotEqual(replaced.image_hash, image.image_hash)
+        with default_storage.open(replaced.renditions['thumbnail']['jpeg']) as file, Image.open(file) as thumbnail:
+            red, _, blue = thumbnail.convert('RGB').getpixel((0, 0))
+        self.assertGreater(blue, red)
+
+    def test_duplicate_deleted_after_commit(self):
+        first = self.upload(self.products[0])
+        copy = ProductImage.objects.create(
+            product=self.products[1], image=default_storage.save('products/copy.png', io.BytesIO(self.png()))
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            process_image(ProductImage, copy.pk)
+        copy.refresh_from_db()
+        self.assertEqual(copy.image.name, first.image.name)
+        self.assertTrue(default_storage.exists('products/copy.png'))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists('products/copy.png'))
+
+    def test_replaced_upload_is_not_overwritten(self):
+        image = self.upload(self.products[0])
+        ProductImage.objects.filter(pk=image.pk).update(image_hash='', renditions={})
+
+        def replaced_while_processing(file, image_hash):
+            ProductImage.objects.filter(pk=image.pk).update(image='products/newer.png')
+            return create_renditions(file, image_hash)
+
+        with mock.patch('api.images.create_renditions', replaced_while_processing):
+            process_image(ProductImage, image.pk)
+        image.refresh_from_db()
+        self.assertEqual((image.image.name, image.image_hash, image.renditions), ('products/newer.png', '', {}))
+
+
+class PrimaryImageTests(ApiTestCase):
+    def test_flag_moves_and_primary_image_follows(self):
+        product = self.products[0]
+        first = ProductImage.objects.create(product=product, image='products/a.png', is_primary=True)
+        second = ProductImage.objects.create(product=product, image='products/b.png')
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_id, first.id)
+
+        second.is_primary = True
+        second.save()
+        first.refresh_from_db()
+        product.refresh_from_db()
+        self.assertFalse(first.is_primary)
+        self.assertEqual(product.primary_image_id, second.id)
+
+        response = self.client.delete(f'/api/products/{product.id}/images/{second.id}/')
+        self.assertEqual(response.status_code, 204)
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_id, first.id)
+
+    def test_one_primary_per_product(self):
+        response = self.client.patch(f'/api/products/{self.products[0].id}/', {'images': [
+            {'image': None, 'is_primary': True}, {'image': None, 'is_primary': True}
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_lean_list(self):
+        for product in self.products:
+            ProductImage.objects.create(product=product, image='products/a.png')
+        response = self.assertQueryCount('/api/products/?lean=true', 2)
+        result = response.data['results'][0]
+        self.assertNotIn('images', result)
+        self.assertTrue(result['primary_image']['url'].endswith('/media/products/a.png'))
+
+
+class ConditionalGetTests(ApiTestCase):
+    def test_not_modified_without_building_the_body(self):
+        first = self.assertQueryCount('/api/products/', 3)
+        self.assertEqual(first['Cache-Control'], settings.CATALOG_CACHE_CONTROL)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+        # Every page and filter has its own validators
+        response = self.client.get('/api/products/?page_size=2', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        url = f'/api/categories/{self.category.id}/'
+        detail = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=detail['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_malformed_lookup_is_not_found(self):
+        for url in ['/api/products/abc/', '/api/categories/abc/', '/api/products/999/']:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_changes_outside_the_rows_read_are_seen(self):
+        urls = [
+            '/api/products/', f'/api/products/{self.products[0].id}/',
+            '/api/categories/', '/api/categories/?with_stats=1'
+        ]
+
+        def assertAllModified():
+            for url, etag in etags.items():
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        # Product representations carry the category name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/categories/{self.category.id}/', {'name': 'Mobiles'}, format='json')
+        assertAllModified()
+
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        # Orders take stock with UPDATEs that leave updated_at alone
+        self.create_orders(1)
+        assertAllModified()
+
+
+class BulkOrderTests(ApiTestCase):
+    def test_results_per_record(self):
+        records = [
+            self.order_payload(),
+            dict(self.order_payload(), customer=None),
+            self.order_payload(self.products[:1], quantity=101),
+            self.order_payload(self.products[1:]),
+        ]
+        response = self.client.post('/api/orders/bulk/', records, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['invalid'], response.data['conflict']), (2, 1, 1))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid', 'conflict', 'created'])
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertIn('customer', results[1]['errors'])
+        self.assertEqual(
+            results[2]['errors']['items'],
+            [{'product': self.products[0].id, 'requested': 101, 'available': 99}]
+        )
+
+        orders = Order.objects.order_by('id')
+        self.assertEqual([order.id for order in orders], [results[0]['id'], results[3]['id']])
+        self.assertEqual(OrderItem.objects.filter(order=results[3]['id']).count(), 2)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [99, 98, 98])
+
+    def test_ndjson(self):
+        lines = [
+            json.dumps(self.order_payload()),
+            '[1, 2]',
+            '{"customer": ',
+            '',
+            json.dumps(self.order_payload(self.products[:1])),
+        ]
+        response = self.client.post(
+            '/api/orders/bulk/', '\n'.join(lines).encode(), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        # Blank lines are skipped, everything else is one record
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid', 'invalid', 'created'])
+        self.assertEqual(results[1]['errors'], {'detail': 'Expected a JSON object'})
+        self.assertEqual(results[2]['errors'], {'detail': 'Expected a JSON object'})
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_body_must_be_a_list(self):
+        for body in ['5', 'true', 'null', '"orders"', '{"customer": 1}']:
+            response = self.client.post('/api/orders/bulk/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.data, {'detail': 'Expected a JSON array or newline-delimited JSON of orders'})
+        self.assertFalse(Order.objects.exists())
+
+    def test_records_across_chunks(self):
+        Product.objects.update(stock=1000)
+        size = OrderViewSet.bulk_chunk_size
+        records = [self.order_payload(self.products[:1]) for _ in range(size + 2)]
+        records[size - 1] = {'customer': self.customer.id}
+        records[size] = 'not an order'
+
+        response = self.client.post('/api/orders/bulk/', records, format='json')
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(size + 2)))
+        self.assertEqual(
+            [result['status'] for result in results[size - 2:]], ['created', 'invalid', 'invalid', 'created']
+        )
+        self.assertEqual(response.data['created'], size)
+        self.assertEqual(Order.objects.count(), size)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 1000 - size)
+
+
+class SalesRollupTests(ApiTestCase):
+    def rollup(self):
+        return sorted(
+            DailySalesRollup.objects.values_list('day', 'product_id', 'status', 'units', 'order_count', 'revenue'),
+            key=repr
+        )
+
+    def assertRollupMatchesOrders(self):
+        """The incrementally maintained rows equal a rebuild from the raw orders."""
+        rows = self.rollup()
+        today = timezone.localdate()
+        rebuild_rollup(today - timedelta(days=1), today + timedelta(days=1))
+        self.assertEqual(rows, self.rollup())
+        return rows
+
+    def test_refreshed_on_create_status_change_and_delete(self):
+        self.create_orders(2)
+        today = timezone.localdate()
+        rows = self.assertRollupMatchesOrders()
+        self.assertIn((today, None, 'pending', 6, 2, Decimal('60.00')), rows)
+        self.assertIn((today, self.products[0].id, 'pending', 2, 2, Decimal('20.00')), rows)
+
+        order = Order.objects.order_by('id').first()
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rows = self.assertRollupMatchesOrders()
+        self.assertIn((today, None, 'pending', 3, 1, Decimal('30.00')), rows)
+        self.assertIn((today, None, 'shipped', 3, 1, Decimal('30.00')), rows)
+
+        for order in Order.objects.all():
+            self.assertEqual(self.client.delete(f'/api/orders/{order.id}/').status_code, 204)
+        self.assertEqual(self.assertRollupMatchesOrders(), [])
+
+    def test_item_changes_and_bulk_orders_apply_deltas(self):
+        self.create_orders(2)
+        order = Order.objects.order_by('id').first()
+        first = order.items.order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/orders/{order.id}/', {'items': [
+                {'id': first.id, 'quantity': 3},
+                {'product': self.products[1].id, 'quantity': 1, 'price': '11.00'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertRollupMatchesOrders()
+
+        records = [self.order_payload(), dict(self.order_payload(self.products[:1]), status='cancelled')]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/orders/bulk/', records, format='json').status_code, 200)
+        rows = self.assertRollupMatchesOrders()
+        self.assertIn((timezone.localdate(), None, 'cancelled', 1, 1, Decimal('30.00')), rows)
+
+    def test_refreshed_when_the_customer_is_deleted(self):
+        self.create_orders(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/customers/{self.customer.id}/').status_code, 204)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(self.assertRollupMatchesOrders(), [])
+
+        stats = self.client.get('/api/dashboard/stats/').data
+        self.assertEqual((stats['total_orders'], Decimal(stats['total_revenue'])), (0, 0))
+        self.assertEqual(stats['top_products'], [])
+
+    def test_rebuild_command(self):
+        self.create_orders(2)
+        expected = self.rollup()
+        DailySalesRollup.objects.all().delete()
+        output = StringIO()
+        DailySalesRollup.objects.create(day=date(2020, 1, 1), status='pending', order_count=1)
+        call_command('rebuild_sales_rollup', chunk_days=1, stdout=output)
+        self.assertEqual(self.rollup(), expected)
+        self.assertIn(f'Rebuilt daily sales rollup with {len(expected)} rows.', output.getvalue())
+
+        Order.objects.all().delete()
+        call_command('rebuild_sales_rollup', stdout=output)
+        self.assertEqual(self.rollup(), [])
+
+    def test_migration_backfills_existing_orders(self):
+        self.create_orders(2)
+        expected = self.rollup()
+        DailySalesRollup.objects.all().delete()
+        import_module('api.migrations.0003_dailysalesrollup').populate_rollup(django_apps, None)
+        self.assertEqual(self.rollup(), expected)
+
+
+class NestedUpdateTests(ApiTestCase):
+    def test_order_items(self):
+        self.create_orders(2)
+        order, other = Order.objects.order_by('id')
+        first, second, third = order.items.order_by('id')
+        response = self.client.patch(f'/api/orders/{order.id}/', {'items': [
+            {'id': first.id, 'quantity': 2},
+            {'id': second.id, 'price': '9.00'},
+            {'product': self.products[0].id, 'quantity': 1, 'price': '10.00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        items = list(order.items.order_by('id').values_list('id', 'product_id', 'quantity', 'price'))
+        self.assertEqual(items[:2], [
+            (first.id, self.products[0].id, 2, Decimal('10.00')),
+            (second.id, self.products[1].id, 1, Decimal('9.00')),
+        ])
+        self.assertEqual(items[2][1:], (self.products[0].id, 1, Decimal('10.00')))
+        self.assertFalse(OrderItem.objects.filter(pk=third.pk).exists())
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)), [96, 98, 99])
+
+        # Without items the existing ones are left alone
+        response = self.client.patch(f'/api/orders/{order.id}/', {'payment_method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(order.items.count(), 3)
+
+        # Items of another order and incomplete new items are rejected, nothing is written
+        foreign = other.items.first()
+        response = self.client.patch(f'/api/orders/{order.id}/', {'items': [
+            {'id': foreign.id, 'quantity': 5}, {'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.data['items'][0])
+        self.assertEqual(set(response.data['items'][1]), {'product', 'price'})
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(OrderItem.objects.get(pk=foreign.pk).quantity, 1)
+
+    def test_product_images(self):
+        product, other = self.products[:2]
+        first = ProductImage.objects.create(product=product, image='products/a.png')
+        second = ProductImage.objects.create(product=product, image='products/b.png')
+        foreign = ProductImage.objects.create(product=other, image='products/c.png')
+
+        response = self.client.patch(f'/api/products/{product.id}/', {'images': [
+            {'id': second.id, 'is_primary': True},
+            {'image': None},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        images = list(product.images.order_by('id').values_list('id', 'image', 'is_primary'))
+        self.assertEqual(images[0], (second.id, 'products/b.png', True))
+        self.assertEqual(len(images), 2)
+        self.assertFalse(ProductImage.objects.filter(pk=first.pk).exists())
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_id, second.id)
+
+        response = self.client.patch(f'/api/products/{product.id}/', {'stock': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(product.images.count(), 2)
+
+        response = self.client.patch(
+            f'/api/products/{product.id}/', {'images': [{'id': foreign.id, 'is_primary': True}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ProductImage.objects.get(pk=foreign.pk).product_id, other.id)
+        self.assertEqual(product.images.count(), 2)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def names(self, response):
+        return [product['name'] for product in response.data['results']]
+
+    def test_pages_stay_stable_while_rows_are_added(self):
+        first = self.client.get('/api/products/?cursor=&page_size=2')
+        self.assertEqual(self.names(first), ['Product 0', 'Product 1'])
+        Product.objects.create(name='Product 3', description='', price=1, category=self.category)
+        self.products[0].delete()
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(self.names(second), ['Product 2', 'Product 3'])
+        self.assertIsNone(second.data['next'])
+
+    def test_page_size_is_capped(self):
+        Product.objects.bulk_create([
+            Product(name=f'Bulk {i}', description='', price=1, category=self.category) for i in range(100)
+        ])
+        response = self.client.get('/api/products/?cursor=&page_size=1000')
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursors(self):
+        tampered = [
+            'not-base64!', urlsafe_b64encode(b'2026-01-01T00:00:00+00:00').decode(),
+            urlsafe_b64encode(b'yesterday|1').decode(), urlsafe_b64encode(b'2026-01-01T00:00:00+00:00|x').decode(),
+        ]
+        for cursor in tampered:
+            self.assertEqual(self.client.get(f'/api/products/?cursor={cursor}').status_code, 404, cursor)
+
+    def test_ordering_conflicts_with_cursor(self):
+        response = self.client.get('/api/products/?cursor=&ordering=-price')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?ordering=-price').status_code, 200)
+
+
+class ProductFilterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        android = Category.objects.create(name='Android', parent=self.category)
+        pixel = Category.objects.create(name='Pixel', parent=android)
+        laptops = Category.objects.create(name='Laptops')
+        for name, price, stock, category, is_active in [
+            ('Budget', '5.00', 0, android, True),
+            ('Pixel 9', '30.00', 3, pixel, False),
+            ('Laptop', '300.00', 1, laptops, True),
+        ]:
+            Product.objects.create(
+                name=name, description='', price=price, stock=stock, category=category, is_active=is_active
+            )
+
+    def names(self, query):
+        response = self.client.get(f'/api/products/?page_size=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def test_filters(self):
+        phones = f'category={self.category.id}'
+        self.assertEqual(self.names(phones), ['Product 0', 'Product 1', 'Product 2'])
+        self.assertEqual(
+            self.names(f'{phones}&include_descendants=true'),
+            ['Product 0', 'Product 1', 'Product 2', 'Budget', 'Pixel 9']
+        )
+        self.assertEqual(
+            self.names(f'{phones}&include_descendants=true&in_stock=true&is_active=true'),
+            ['Product 0', 'Product 1', 'Product 2']
+        )
+        self.assertEqual(self.names('min_price=11&max_price=30'), ['Product 1', 'Product 2', 'Pixel 9'])
+        self.assertEqual(self.names('category=999&include_descendants=true'), [])
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.names('ordering=-price'),
+            ['Laptop', 'Pixel 9', 'Product 2', 'Product 1', 'Product 0', 'Budget']
+        )
+        self.assertEqual(self.names('ordering=stock&max_price=10')[0], 'Budget')
+
+    def test_invalid_parameters(self):
+        for query in [
+            'ordering=description', 'min_price=cheap', 'min_price=NaN', 'max_price=Infinity', 'max_price=-inf',
+            'in_stock=yes', 'category=phones'
+        ]:
+            self.assertEqual(self.client.get(f'/api/products/?{query}').status_code, 400, query)
+
+    def test_facets(self):
+        response = self.client.get(f'/api/products/?category={self.category.id}&include_descendants=true&facets=true')
+        facets = response.data['facets']
+        self.assertEqual(
+            [(category['name'], category['count']) for category in facets['categories']],
+            [('Phones', 3), ('Android', 1), ('Pixel', 1)]
+        )
+        self.assertEqual(facets['price_bands'], [
+            {'min': 0, 'max': 10, 'count': 1},
+            {'min': 10, 'max': 25, 'count': 3},
+            {'min': 25, 'max': 50, 'count': 1},
+        ])
+        self.assertEqual((facets['in_stock'], facets['active']), (4, 4))
+
+
+class ProductSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        accessories = Category.objects.create(name='Accessories')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.charger = Product.objects.create(
+                name='Charger', description='Fast charging for your blue phone', price=20, category=accessories
+            )
+            for name in ['Blue phone case', 'Bluetooth speaker']:
+                Product.objects.create(name=name, description='Accessory', price=15, category=accessories)
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return [product['name'] for product in response.data['results']]
+
+    def test_name_matches_rank_first(self):
+        names = self.search('blue')
+        self.assertEqual(set(names[:2]), {'Blue phone case', 'Bluetooth speaker'})
+        self.assertEqual(names[2:], ['Charger'])
+        self.assertEqual(self.search('blue phone'), ['Blue phone case', 'Charger'])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('charg'), ['Charger'])
+        self.assertEqual(set(self.search('accessor')), {'Charger', 'Blue phone case', 'Bluetooth speaker'})
+        self.assertEqual(self.client.get('/api/products/search/', {'q': '  '}).status_code, 400)
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{self.charger.id}/', {'name': 'Cable'}, format='json')
+        self.assertEqual(self.search('charger'), [])
+        self.assertEqual(self.search('cable'), ['Cable'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/products/{self.charger.id}/')
+        self.assertEqual(self.search('cable'), [])
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='api.search.DatabaseSearchBackend')
+    def test_database_backend(self):
+        self.assertEqual(self.search('blue'), ['Blue phone case', 'Bluetooth speaker', 'Charger'])
+        self.assertEqual(self.search('phone blue'), ['Blue phone case', 'Charger'])
+        self.assertEqual(self.search('accessories'), ['Charger', 'Blue phone case', 'Bluetooth speaker'])
+
+
+class CategoryTreeTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.android = Category.objects.create(name='Android', parent=self.category)
+        self.pixel = Category.objects.create(name='Pixel', parent=self.android)
+        self.laptops = Category.objects.create(name='Laptops')
+        Product.objects.create(name='Pixel 9', description='', price=30, category=self.pixel)
+
+    def test_moving_a_subtree_rewrites_descendants(self):
+        response = self.client.patch(
+            f'/api/categories/{self.android.id}/', {'parent': self.laptops.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.android.refresh_from_db()
+        self.pixel.refresh_from_db()
+        self.assertEqual((self.android.path, self.android.depth), (f'{self.laptops.id}/{self.android.id}/', 1))
+        self.assertEqual(
+            (self.pixel.path, self.pixel.depth), (f'{self.laptops.id}/{self.android.id}/{self.pixel.id}/', 2)
+        )
+
+        self.android.parent = None
+        self.android.save()
+        self.pixel.refresh_from_db()
+        self.assertEqual((self.pixel.path, self.pixel.depth), (f'{self.android.id}/{self.pixel.id}/', 1))
+
+    def test_cycles_are_rejected(self):
+        for parent in [self.category, self.pixel]:
+            response = self.client.patch(
+                f'/api/categories/{self.category.id}/', {'parent': parent.id}, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('parent', response.data)
+        self.category.refresh_from_db()
+        self.assertIsNone(self.category.parent_id)
+
+    def test_tree(self):
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node['name'] for node in response.data], ['Laptops', 'Phones'])
+        phones = response.data[1]
+        self.assertEqual((phones['product_count'], phones['total_product_count']), (3, 4))
+        android = phones['children'][0]
+        self.assertEqual((android['name'], android['depth'], android['total_product_count']), ('Android', 1, 1))
+        self.assertEqual(android['children'][0]['name'], 'Pixel')
+        self.assertEqual(android['children'][0]['children'], [])
+
+        self.android.delete()
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual([node['name'] for node in response.data], ['Laptops', 'Phones', 'Pixel'])
+        self.assertEqual(response.data[2]['depth'], 0)
+
+
+class CategorySummaryTests(ApiTestCase):
+    def summary(self, category):
+        response = self.client.get(f'/api/categories/{category.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['products_info']
+
+    def test_summary(self):
+        Product.objects.filter(pk=self.products[0].pk).update(is_active=False)
+        summary = self.summary(self.category)
+        self.assertEqual((summary['count'], summary['active_count']), (3, 2))
+        self.assertEqual((summary['min_price'], summary['max_price']), ('11.00', '12.00'))
+        self.assertEqual([product['name'] for product in summary['products']], ['Product 1', 'Product 2'])
+
+    def test_product_writes_invalidate_the_cache(self):
+        self.assertEqual(self.summary(self.category)['count'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Cheap', description='', price=1, category=self.category)
+        self.assertEqual(self.summary(self.category)['min_price'], '1.00')
+
+        laptops = Category.objects.create(name='Laptops')
+        self.assertEqual(self.summary(laptops)['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{product.id}/', {'category': laptops.id}, format='json')
+        self.assertEqual(self.summary(self.category)['count'], 3)
+        self.assertEqual(self.summary(laptops)['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/products/{product.id}/')
+        self.assertEqual(self.summary(laptops)['count'], 0)
+
+    def test_category_delete_invalidates_the_cache(self):
+        category_id = self.category.id
+        self.assertEqual(category_summary(category_id)['count'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual(category_summary(category_id), empty_summary())
+
+    def test_list_with_stats_reads_the_cache(self):
+        Category.objects.create(name='Laptops')
+        response = self.assertQueryCount('/api/categories/?with_stats=1', 4)
+        self.assertEqual([category['products_info']['count'] for category in response.data['results']], [3, 0])
+        self.assertQueryCount('/api/categories/?with_stats=1', 2)
+
+
+class ExportTests(ApiTestCase):
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def csv_rows(self, url):
+        return list(csv.DictReader(io.StringIO(self.export(url))))
+
+    def test_order_csv(self):
+        self.create_orders(2)
+        response = self.client.get('/api/export/orders/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+
+        rows = self.csv_rows('/api/export/orders/')
+        order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual([int(row['order_id']) for row in rows], [order_ids[0]] * 3 + [order_ids[1]] * 3)
+        self.assertEqual(
+            [(row['product_name'], row['quantity'], row['price']) for row in rows[:3]],
+            [('Product 0', '1', '10.00'), ('Product 1', '1', '11.00'), ('Product 2', '1', '12.00')]
+        )
+        self.assertEqual(rows[0]['customer_username'], 'alice')
+
+        Order.objects.filter(pk=order_ids[0]).update(status='cancelled')
+        rows = self.csv_rows('/api/export/orders/?status=cancelled')
+        self.assertEqual({int(row['order_id']) for row in rows}, {order_ids[0]})
+
+    def test_product_and_customer_exports(self):
+        rows = self.csv_rows('/api/export/products/')
+        self.assertEqual([row['name'] for row in rows], ['Product 0', 'Product 1', 'Product 2'])
+        self.assertEqual((rows[0]['category_name'], rows[0]['is_active']), ('Phones', 'True'))
+
+        records = [json.loads(line) for line in self.export('/api/export/customers/?output=ndjson').splitlines()]
+        self.assertEqual([record['username'] for record in records], ['alice'])
+
+    def test_date_range(self):
+        self.create_orders(3)
+        today = timezone.localdate()
+        old, older, current = Order.objects.order_by('id')
+        Order.objects.filter(pk=old.pk).update(created_at=day_start(today - timedelta(days=2)))
+        Order.objects.filter(pk=older.pk).update(created_at=day_start(today - timedelta(days=5)))
+
+        def order_ids(query):
+            lines = self.export(f'/api/export/orders/?output=ndjson&{query}').splitlines()
+            return [json.loads(line)['id'] for line in lines]
+
+        self.assertEqual(order_ids(f'from={today - timedelta(days=2)}'), [old.id, current.id])
+        self.assertEqual(order_ids(f'to={today - timedelta(days=2)}'), [old.id, older.id])
+        self.assertEqual(order_ids(f'from={today - timedelta(days=5)}&to={today - timedelta(days=3)}'), [older.id])
+        self.assertEqual(order_ids(f'from={today + timedelta(days=1)}'), [])
+
+    def test_invalid_parameters(self):
+        for url in [
+            '/api/export/orders/?from=2024-13-01',
+            '/api/export/orders/?to=yesterday',
+            '/api/export/orders/?output=xml',
+            '/api/export/orders/?status=lost',
+            '/api/export/products/?is_active=yes',
+        ]:
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+
+class RevenueStatsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_orders(4)
+        for order, day in zip(Order.objects.order_by('id'), ['2024-01-01', '2024-01-03', '2024-01-10', '2024-02-15']):
+            Order.objects.filter(pk=order.pk).update(created_at=day_start(date.fromisoformat(day)))
+        rebuild_rollup(date(2023, 12, 1), date(2024, 3, 1))
+
+    def revenue(self, query):
+        response = self.client.get(f'/api/dashboard/revenue/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_granularities(self):
+        data = self.revenue('from=2024-01-01&to=2024-01-03')
+        self.assertEqual((data['granularity'], data['from'], data['to']), ('day', '2024-01-01', '2024-01-03'))
+        self.assertEqual(
+            [(bucket['date'], bucket['revenue']) for bucket in data['revenue']],
+            [('2024-01-03', '30.00'), ('2024-01-02', '0'), ('2024-01-01', '30.00')]
+        )
+        data = self.revenue('granularity=week&from=2024-01-01&to=2024-01-14')
+        self.assertEqual(data['revenue'], [
+            {'week': '2024-01-08 to 2024-01-14', 'revenue': '30.00'},
+            {'week': '2024-01-01 to 2024-01-07', 'revenue': '60.00'},
+        ])
+        data = self.revenue('granularity=month&from=2024-01-15&to=2024-02-29')
+        self.assertEqual(data['revenue'], [
+            {'month': '2024-02', 'revenue': '30.00'},
+            {'month': '2024-01', 'revenue': '90.00'},
+        ])
+
+    def test_default_window(self):
+        data = self.revenue('to=2024-01-03')
+        self.assertEqual(data['from'], '2023-12-28')
+        self.assertEqual(len(data['revenue']), 7)
+        data = self.revenue('granularity=month&to=2024-02-15')
+        self.assertEqual(data['revenue'][-1]['month'], '2023-09')
+
+        overview = self.revenue('')
+        self.assertEqual([len(overview[key]) for key in ('daily', 'weekly', 'monthly')], [7, 4, 6])
+        self.assertEqual(overview['daily'][0]['date'], timezone.localdate().isoformat())
+
+    def test_bucket_cap(self):
+        self.assertEqual(len(self.revenue('granularity=month&from=2000-01-01&to=2024-01-01')['revenue']), 289)
+        response = self.client.get('/api/dashboard/revenue/?from=2000-01-01&to=2024-01-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_parameters(self):
+        for query in ['granularity=year', 'from=2024-02-30', 'to=today', 'from=2024-02-01&to=2024-01-01']:
+            self.assertEqual(self.client.get(f'/api/dashboard/revenue/?{query}').status_code, 400, query)
+
+
+class ProductSalesTests(ApiTestCase):
+    def assertCounters(self, expected):
+        counters = list(Product.objects.order_by('id').values_list('units_sold', 'revenue'))
+        self.assertEqual(counters, [(units, Decimal(revenue)) for units, revenue in expected])
+        self.assertEqual(reconcile_product_sales([product.id for product in self.products]), 0)
+
+    def test_counters_follow_order_writes(self):
+        self.create_orders(2)
+        self.assertCounters([(2, '20.00'), (2, '22.00'), (2, '24.00')])
+
+        order, other = Order.objects.order_by('id')
+        first, second, _ = order.items.order_by('id')
+        response = self.client.patch(f'/api/orders/{order.id}/', {'items': [
+            {'id': first.id, 'quantity': 3},
+            {'id': second.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCounters([(4, '40.00'), (2, '22.00'), (1, '12.00')])
+
+        for status_value, expected in [
+            ('cancelled', [(1, '10.00'), (1, '11.00'), (1, '12.00')]),
+            ('pending', [(4, '40.00'), (2, '22.00'), (1, '12.00')]),
+        ]:
+            response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': status_value}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertCounters(expected)
+
+        self.assertEqual(self.client.delete(f'/api/orders/{other.id}/').status_code, 204)
+        self.assertCounters([(3, '30.00'), (1, '11.00'), (0, '0.00')])
+
+        records = [self.order_payload(self.products[1:]), dict(self.order_payload(), status='cancelled')]
+        self.assertEqual(self.client.post('/api/orders/bulk/', records, format='json').status_code, 200)
+        self.assertCounters([(3, '30.00'), (2, '22.00'), (1, '12.00')])
+
+    def test_top_products(self):
+        self.create_orders(1)
+        self.client.post('/api/orders/', self.order_payload(self.products[1:], quantity=2), format='json')
+        self.client.post('/api/orders/', self.order_payload(self.products[2:]), format='json')
+        response = self.client.get('/api/dashboard/top-products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {'id': self.products[2].id, 'name': 'Product 2', 'total_sold': 4, 'revenue': '48.00'},
+            {'id': self.products[1].id, 'name': 'Product 1', 'total_sold': 3, 'revenue': '33.00'},
+            {'id': self.products[0].id, 'name': 'Product 0', 'total_sold': 1, 'revenue': '10.00'},
+        ])
+
+    def test_reconcile_command_repairs_drift(self):
+        self.create_orders(2)
+        Product.objects.update(units_sold=0)
+        output = StringIO()
+        call_command('reconcile_product_sales', chunk_size=2, stdout=output)
+        self.assertIn('Checked 3 products, repaired 3.', output.getvalue())
+        self.assertCounters([(2, '20.00'), (2, '22.00'), (2, '24.00')])
+
+
+class StockReservationTests(ApiTestCase):
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_conflict_lists_short_items(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=1)
+        response = self.client.post('/api/orders/', self.order_payload(quantity=2), format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['items'], [{'product': self.products[0].id, 'requested': 2, 'available': 1}])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), [1, 100, 100])
+
+    def test_cancel_restores_stock(self):
+        self.create_orders(1)
+        self.assertEqual(self.stock(), [99, 99, 99])
+        order = Order.objects.get()
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), [100, 100, 100])
+
+    def test_customer_delete_returns_stock(self):
+        self.create_orders(2)
+        self.assertEqual(self.stock(), [98, 98, 98])
+        self.client.delete(f'/api/customers/{self.customer.id}/')
+        self.assertEqual(self.stock(), [100, 100, 100])
+
+    def admin_order_form(self, quantity):
+        return {
+            'customer': self.customer.id, 'status': 'pending', 'total_price': '10.00',
+            'shipping_address': 'Main street 1', 'payment_method': 'card',
+            'items-TOTAL_FORMS': 1, 'items-INITIAL_FORMS': 0, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            'items-0-product': self.products[0].id, 'items-0-quantity': quantity, 'items-0-price': '10.00',
+        }
+
+    def test_admin_reports_shortage_as_form_error(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        Product.objects.filter(pk=self.products[0].pk).update(stock=0)
+        response = self.client.post('/admin/api/order/add/', self.admin_order_form(1))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Not enough stock of Product 0: 1 more requested, 0 available.')
+        self.assertFalse(Order.objects.exists())
+
+        Product.objects.filter(pk=self.products[0].pk).update(stock=2)
+        response = self.client.post('/admin/api/order/add/', self.admin_order_form(2))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stock(), [0, 100, 100])
+
+        item = OrderItem.objects.get()
+        response = self.client.post(f'/admin/api/orderitem/{item.id}/change/', {
+            'order': item.order_id, 'product': item.product_id, 'quantity': 3, 'price': '10.00'
+        })
+        self.assertContains(response, 'Not enough stock of Product 0: 1 more requested, 0 available.')
+        response = self.client.post(f'/admin/api/orderitem/{item.id}/change/', {
+            'order': item.order_id, 'product': item.product_id, 'quantity': 1, 'price': '10.00'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stock(), [1, 100, 100])
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    'Threads need their own connections to a file-backed database'
+)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_same_sku_is_never_oversold(self):
+        category = Category.objects.create(name='Phones')
+        product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category, stock=5)
+        customer = Customer.objects.create(user=User.objects.create(username='alice'))
+        payload = {
+            'customer': customer.id,
+            'total_price': '10.00',
+            'shipping_address': 'Main street 1',
+            'payment_method': 'card',
+            'items': [{'product': product.id, 'quantity': 1, 'price': '10.00'}]
+        }
+        statuses = []
+
+        def checkout():
+            try:
+                statuses.append(APIClient().post('/api/orders/', payload, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Counter(statuses), {201: 5, 409: 15})
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 5)
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    'Async views query from worker threads, which need a file-backed database'
+)
+class AsyncDashboardTests(TransactionTestCase):
+    def setUp(self):
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+        category = Category.objects.create(name='Phones')
+        product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category, stock=10)
+        customer = Customer.objects.create(user=User.objects.create(username='alice'))
+        self.client.post('/api/orders/', {
+            'customer': customer.id,
+            'total_price': '20.00',
+            'shipping_address': 'Main street 1',
+            'payment_method': 'card',
+            'items': [{'product': product.id, 'quantity': 2, 'price': '10.00'}]
+        }, content_type='application/json')
+
+    def get_async(self, view, path, **headers):
+        request = AsyncRequestFactory().get(path, headers=headers)
+        return asyncio.run(view.as_view()(request))
+
+    def test_stats_match_sync_view(self):
+        expected = self.client.get('/api/dashboard/stats/').json()
+        response = self.get_async(AsyncDashboardStatsView, '/api/dashboard/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected)
+
+        response = self.get_async(AsyncDashboardStatsView, '/api/dashboard/stats/', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_revenue_errors(self):
+        response = self.get_async(AsyncRevenueStatsView, '/api/dashboard/revenue/?granularity=year')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid granularity', json.loads(response.content)['detail'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=self.category, stock=10)
+        caches['default'].clear()
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+
+    def get_queries(self, path):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.get_queries('/api/products/')[0], 0)
+        self.assertEqual(self.get_queries('/api/dashboard/top-products/')[0], 0)
+        # Except for the cached category summary, which is computed on the primary once
+        self.assertEqual(self.get_queries(f'/api/categories/{self.category.id}/')[0], 2)
+        self.assertEqual(self.get_queries(f'/api/categories/{self.category.id}/')[0], 0)
+        # Other actions stay on the primary
+        self.assertEqual(self.get_queries('/api/categories/tree/')[1], 0)
+
+    def test_writer_reads_own_writes(self):
+        response = self.client.patch(f'/api/products/{self.product.id}/', {'stock': 5}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.get_queries('/api/products/')[1], 0)
+
+        # Cached dashboard figures are not recomputed from a lagging replica
+        self.client.cookies.clear()
+        self.assertEqual(self.get_queries('/api/dashboard/top-products/')[1], 0)
+        self.assertEqual(self.get_queries('/api/products/')[0], 0)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output checked is SQLite specific')
+class IndexUsageTests(ApiTestCase):
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertRegex(plan, r'USING (COVERING )?INDEX')
+        if index_name:
+            self.assertIn(index_name, plan)
+        self.assertIsNone(re.search(r'SCAN \w+$', plan, re.MULTILINE), plan)
+
+    def test_order_created_at_range(self):
+        self.assertUsesIndex(
+            Order.objects.filter(
+                created_at__gte=day_start(date(2026, 1, 1)),
+                created_at__lt=day_start(date(2026, 2, 1))
+            ),
+            'api_order_created_id_idx'
+        )
+
+    def test_recent_orders(self):
+        self.assertUsesIndex(Order.objects.order_by('-created_at')[:5], 'api_order_created_id_idx')
+
+    def test_order_status(self):
+        self.assertUsesIndex(
+            Order.objects.filter(status='pending', created_at__gte=day_start(date(2026, 1, 1))),
+            'api_order_status_created_idx'
+        )
+
+    def test_active_products_in_category(self):
+        self.assertUsesIndex(Product.objects.filter(category=self.category, is_active=True))
+
+    def test_newest_active_products(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True).order_by('-created_at'),
+            'api_product_active_new_idx'
+        )
+
+    def test_primary_image(self):
+        self.assertUsesIndex(
+            ProductImage.objects.filter(product=self.products[0], is_primary=True),
+            'unique_primary_image'
+        )
+
+    def test_revenue_rollup_range(self):
+        self.assertUsesIndex(
+            DailySalesRollup.objects.filter(
+                product__isnull=True,
+                day__gte=date(2026, 1, 1),
+                day__lt=date(2026, 2, 1)
+            )
+        )
+
+    def test_available_products_by_price(self):
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True, stock__gt=0, price__lte=50).order_by('price'),
+            'api_product_available_idx'
+        )
@@ -0,0 +1,178 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .inventory import apply_stock_delta
+from .models import Order, OrderItem, Product
+from .rollup import apply_rollup_delta, line_total, rollup_day
+
+
+def order_sales(order):
+    """Units and revenue per product for the items ``order`` has in the database."""
+    rows = (
+        order.items
+        .values('product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(line_total()))
+        .order_by()
+    )
+    return {row['product_id']: (row['units'], row['revenue']) for row in rows}
+
+
+def counted_sales(status, sales):
+    # Cancelled orders do not count towards product sales
+    return {} if status == 'cancelled' else sales
+
+
+def sold_units(sales):
+    return {product_id: units for product_id, (units, _) in sales.items()}
+
+
+def snapshot_order(order):
+    """
+    Capture what ``order`` contributes to the daily sales rollup and the
+    product sales counters, as stored in the database, before it is written.
+    """
+    if order.pk is None:
+        return None
+    status, total = Order.objects.filter(pk=order.pk).values_list('status', 'total_price').first() or (None, 0)
+    return {
+        'day': rollup_day(order.created_at),
+        'status': status,
+        'total': total,
+        'sales': order_sales(order)
+    }
+
+
+def rollup_delta(removed, added):
+    """
+    Change of the daily sales rollup from the orders captured in ``removed``
+    to those in ``added``, in the form taken by :func:`api.rollup.apply_rollup_delta`.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for sign, snapshots in ((-1, removed), (1, added)):
+        for snapshot in snapshots:
+            if snapshot is None:
+                continue
+            day, status, sales = snapshot['day'], snapshot['status'], snapshot['sales']
+            rows = {(day, None, status): (1, sum(units for units, _ in sales.values()), snapshot['total'])}
+            for product_id, (units, revenue) in sales.items():
+                rows[(day, product_id, status)] = (1, units, revenue)
+            for key, values in rows.items():
+                for index, value in enumerate(values):
+                    deltas[key][index] += sign * value
+    return deltas
+
+
+def apply_sales_delta(before, after):
+    """Move Product.units_sold/revenue from the ``before`` to the ``after`` sales."""
+    deltas = defaultdict(lambda: [0, 0])
+    for product_id, (units, revenue) in after.items():
+        deltas[product_id][0] += units
+        deltas[product_id][1] += revenue
+    for product_id, (units, revenue) in before.items():
+        deltas[product_id][0] -= units
+        deltas[product_id][1] -= revenue
+
+    # Products are updated in id order so concurrent writers take row locks in the same order
+    for product_id in sorted(deltas):
+        units, revenue = deltas[product_id]
+        if units or revenue:
+            Product.objects.filter(pk=product_id).update(
+                units_sold=F('units_sold') + units,
+                revenue=F('revenue') + revenue
+            )
+
+
+@transaction.atomic
+def order_written(order, before=None):
+    """
+    Update the stock reservations, rollup and sales counters after ``order``
+    or its items were saved. Raises InsufficientStock when the order now
+    holds more stock than is available.
+    """
+    after = snapshot_order(order)
+    before_counted = counted_sales(before['status'], before['sales']) if before else {}
+    after_counted = counted_sales(after['status'], after['sales'])
+    apply_stock_delta(sold_units(before_counted), sold_units(after_counted))
+    apply_rollup_delta(rollup_delta([before], [after]))
+    apply_sales_delta(before_counted, after_counted)
+
+
+@transaction.atomic
+def order_deleted(before):
+    """Release the stock, update the rollup and sales counters after the order captured in ``before`` was deleted."""
+    counted = counted_sales(before['status'], before['sales'])
+    apply_stock_delta(sold_units(counted), {})
+    apply_rollup_delta(rollup_delta([before], []))
+    apply_sales_delta(counted, {})
+
+
+@transaction.atomic
+def orders_created(orders, items):
+    """
+    Update the rollup and sales counters for freshly bulk-inserted orders and
+    items. Their stock must already have been reserved.
+    """
+    order_items = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for item in items:
+        product_sales = order_items[item.order.pk][item.product_id]
+        product_sales[0] += item.quantity
+        product_sales[1] += item.price * item.quantity
+
+    snapshots = []
+    sales = defaultdict(lambda: [0, 0])
+    for order in orders:
+        products = {product_id: tuple(totals) for product_id, totals in order_items[order.pk].items()}
+        snapshots.append({
+            'day': rollup_day(order.created_at),
+            'status': order.status,
+            'total': order.total_price,
+            'sales': products
+        })
+        for product_id, (units, revenue) in counted_sales(order.status, products).items():
+            sales[product_id][0] += units
+            sales[product_id][1] += revenue
+
+    apply_rollup_delta(rollup_delta([], snapshots))
+    apply_sales_delta({}, sales)
+
+
+def top_selling_products(limit):
+    top_products = Product.objects.filter(units_sold__gt=0).order_by('-units_sold')[:limit]
+    return [
+        {
+            'id': product.id,
+            'name': product.name,
+            'total_sold': product.units_sold,
+            'revenue': str(product.revenue)
+        }
+        for product in top_products
+    ]
+
+
+def reconcile_product_sales(product_ids):
+    """
+    Recompute the sales counters of ``product_ids`` from their order items
+    and repair any that drifted. Returns the number of products corrected.
+    """
+    actual = {
+        row['product_id']: (row['units'], row['revenue'])
+        for row in (
+            OrderItem.objects
+            .filter(product_id__in=product_ids)
+            .exclude(order__status='cancelled')
+            .values('product_id')
+            .annotate(units=Sum('quantity'), revenue=Sum(line_total()))
+            .order_by()
+        )
+    }
+    drifted = []
+    for product in Product.objects.filter(pk__in=product_ids).only('id', 'units_sold', 'revenue'):
+        units, revenue = actual.get(product.id, (0, 0))
+        if product.units_sold != units or product.revenue != revenue:
+            product.units_sold = units
+            product.revenue = revenue
+            drifted.append(product)
+    Product.objects.bulk_update(drifted, ['units_sold', 'revenue'])
+    return len(drifted)
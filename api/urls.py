@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategoryViewSet, ProductViewSet, CustomerViewSet, OrderViewSet,
-    DashboardStatsView, TopProductsView, TopCustomersView, RevenueStatsView
+    DashboardStatsView, TopProductsView, TopCustomersView, RevenueStatsView, DashboardCacheStatsView,
+    OrderExportView, ProductExportView, CustomerExportView
 )
+from .instrumentation import metrics_view
+
+if settings.DASHBOARD_ASYNC_VIEWS:
+    from .async_views import (
+        AsyncDashboardStatsView as DashboardStatsView,
+        AsyncTopProductsView as TopProductsView,
+        AsyncTopCustomersView as TopCustomersView,
+        AsyncRevenueStatsView as RevenueStatsView,
+    )
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
@@ -12,9 +23,14 @@ router.register(r'customers', CustomerViewSet)
 router.register(r'orders', OrderViewSet)
 
 urlpatterns = [
+    path('_metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
     path('dashboard/top-products/', TopProductsView.as_view(), name='top-products'),
     path('dashboard/top-customers/', TopCustomersView.as_view(), name='top-customers'),
     path('dashboard/revenue/', RevenueStatsView.as_view(), name='revenue-stats'),
+    path('dashboard/cache-stats/', DashboardCacheStatsView.as_view(), name='dashboard-cache-stats'),
+    path('export/orders/', OrderExportView.as_view(), name='export-orders'),
+    path('export/products/', ProductExportView.as_view(), name='export-products'),
+    path('export/customers/', CustomerExportView.as_view(), name='export-customers'),
 ]
@@ -1,29 +1,281 @@
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from django.db.models import Sum, Count
-from django.utils import timezone
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from collections import Counter
 from datetime import timedelta
+from itertools import islice
+from types import GeneratorType
 
 from .models import Category, Product, ProductImage, Customer, Order, OrderItem
 from .serializers import (
-    CategorySerializer, CategoryDetailSerializer, ProductSerializer,
-    ProductImageSerializer, CustomerSerializer, OrderSerializer, OrderItemSerializer
+    CategorySerializer, CategoryDetailSerializer, ProductSerializer, ProductLeanSerializer,
+    ProductImageSerializer, CustomerSerializer, OrderSerializer, OrderItemSerializer, sparse_queryset
 )
-
-
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+from .cache import catalog_validators, get_stats, versioned_cache
+from .catalog import category_summaries, product_facets
+from .dashboard import (
+    parse_date_param, recent_orders, revenue_report, top_customers, total_orders, total_revenue
+)
+from .fast_serialization import serializer_plan
+from .filters import ProductFilterBackend
+from .exports import (
+    EXPORT_CHUNK_SIZE, ORDER_CSV_HEADER, PRODUCT_CSV_HEADER, CUSTOMER_CSV_HEADER,
+    csv_stream, ndjson_stream, order_record, order_csv_rows, product_record, product_csv_rows,
+    customer_record, customer_csv_rows
+)
+from .pagination import KeysetPagination
+from .instrumentation import timed_serialization
+from .parsers import NDJSONParser
+from .rollup import day_start
+from .search import get_search_backend, query_terms
+from .tracking import order_written, snapshot_order, top_selling_products
+
+
+class TimedSerializationMixin:
+    """
+    DRF's list and retrieve, with the serializer data produced under
+    :func:`~api.instrumentation.timed_serialization`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page if page is not None else queryset, many=True)
+        with timed_serialization():
+            data = serializer.data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        with timed_serialization():
+            data = serializer.data
+        return Response(data)
+
+
+class SparseFieldsetMixin:
+    """
+    Load only what the ``?fields=``/``?expand=`` of list and retrieve requests
+    need, see :class:`api.serializers.SparseFieldsetMixin`.
+    """
+
+    def get_queryset(self):
+        return self.apply_sparse_fieldset(super().get_queryset())
+
+    def apply_sparse_fieldset(self, queryset):
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        serializer = self.get_serializer()
+        names = serializer.sparse_field_names()
+        if names is None:
+            return queryset
+        # Keyset pagination orders and builds its cursors on created_at
+        return sparse_queryset(queryset, serializer, names, always=['created_at'])
+
+
+class FastListMixin:
+    """
+    Serve list requests for :attr:`fast_list_serializer` from ``values()``
+    rows through its precompiled :class:`~api.fast_serialization.SerializerPlan`,
+    with the same output but no model instance or serializer per row.
+    Sparse fieldsets and keyset pages, whose cursors are read from model
+    instances, take the regular path.
+    """
+    fast_list_serializer = None
+
+    def use_fast_list(self):
+        return (
+            settings.FAST_LIST_SERIALIZATION
+            and self.get_serializer_class() is self.fast_list_serializer
+            and KeysetPagination.cursor_query_param not in self.request.query_params
+            and self.get_serializer().sparse_field_names() is None
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_list():
+            return super().list(request, *args, **kwargs)
+
+        plan = serializer_plan(self.fast_list_serializer)
+        rows = plan.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        with timed_serialization():
+            data = plan.represent(page if page is not None else rows, self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve requests whose ``If-None-Match`` or
+    ``If-Modified-Since`` still match with 304 before the body is built,
+    using the validators of :func:`api.cache.catalog_validators`. Full
+    responses carry them along with ``CATALOG_CACHE_CONTROL``, and lists
+    reuse the row count of the check for their page count.
+    """
+    object_count = None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except (TypeError, ValueError, ValidationError):
+                # Malformed lookups are answered with get_object()'s 404
+                return handler(request, *args, **kwargs)
+        validators = catalog_validators(request, queryset)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified, self.object_count = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = settings.CATALOG_CACHE_CONTROL
+        return response
+
+
+class CategoryViewSet(ConditionalGetMixin, SparseFieldsetMixin, TimedSerializationMixin, viewsets.ModelViewSet):
+    queryset = CategorySerializer.setup_eager_loading(Category.objects.order_by('id'))
+
+    def with_stats(self):
+        return self.action == 'list' and self.request.query_params.get('with_stats') == '1'
 
     def get_serializer_class(self):
-        if self.action == 'retrieve':
+        if self.action == 'retrieve' or self.with_stats():
             return CategoryDetailSerializer
         return CategorySerializer
 
-
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    def list(self, request, *args, **kwargs):
+        if not self.with_stats():
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(self.list_with_stats, request, *args, **kwargs)
+
+    def list_with_stats(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        categories = list(page if page is not None else queryset)
+        context = self.get_serializer_context()
+        context['category_summaries'] = category_summaries([category.id for category in categories])
+        serializer = self.get_serializer(categories, many=True, context=context)
+        with timed_serialization():
+            data = serializer.data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        categories = Category.objects.annotate(
+            product_count=Count('products')
+        ).order_by('name').values('id', 'name', 'parent_id', 'path', 'depth', 'product_count')
+
+        nodes = {}
+        for category in categories:
+            nodes[category['id']] = {
+                'id': category['id'],
+                'name': category['name'],
+                'parent': category['parent_id'],
+                'depth': category['depth'],
+                'product_count': category['product_count'],
+                'total_product_count': 0,
+                'children': []
+            }
+        # Every product counts towards its category and all of the category's ancestors
+        for category in categories:
+            for ancestor_id in category['path'].split('/')[:-1]:
+                nodes[int(ancestor_id)]['total_product_count'] += category['product_count']
+
+        roots = []
+        for category in categories:
+            node = nodes[category['id']]
+            if node['parent'] is None:
+                roots.append(node)
+            else:
+                nodes[node['parent']]['children'].append(node)
+        return Response(roots)
+
+
+class ProductViewSet(ConditionalGetMixin, FastListMixin, SparseFieldsetMixin, TimedSerializationMixin, viewsets.ModelViewSet):
+    queryset = ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))
     serializer_class = ProductSerializer
+    fast_list_serializer = ProductSerializer
+
+    filter_backends = [ProductFilterBackend]
+
+    def lean(self):
+        return self.action == 'list' and self.request.query_params.get('lean') == 'true'
+
+    def get_queryset(self):
+        if self.lean():
+            return self.apply_sparse_fieldset(ProductLeanSerializer.setup_eager_loading(Product.objects.order_by('id')))
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if self.lean():
+            return ProductLeanSerializer
+        return ProductSerializer
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and request.query_params.get('facets') == 'true':
+            facets = product_facets(self.filter_queryset(self.get_queryset()))
+            if isinstance(response.data, dict):
+                response.data['facets'] = facets
+            else:
+                response.data = {'results': response.data, 'facets': facets}
+        return response
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '')
+        if not query_terms(query):
+            raise ParseError("Query parameter 'q' is required")
+
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            raise ParseError("Invalid page")
+        page_size = self.paginator.get_page_size(request)
+
+        backend = get_search_backend()
+        ids = backend.ranked_ids(query, page_size, (page - 1) * page_size)
+        products = ProductSerializer.setup_eager_loading(Product.objects.all()).in_bulk(ids)
+        serializer = self.get_serializer([products[pk] for pk in ids if pk in products], many=True)
+        with timed_serialization():
+            results = serializer.data
+
+        matches = Product.objects.filter(backend.matching(query))
+        count = backend.count(query)
+        url = request.build_absolute_uri()
+        return Response({
+            'count': count,
+            'next': replace_query_param(url, 'page', page + 1) if page * page_size < count else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': results,
+            'facets': product_facets(matches)
+        })
 
     @action(detail=True, methods=['post'])
     def images(self, request, pk=None):
@@ -31,7 +283,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = ProductImageSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save(product=product)
+            # Moving the primary flag and refreshing Product.primary_image go with the save
+            with transaction.atomic():
+                serializer.save(product=product)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -39,7 +293,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     def delete_image(self, request, pk=None, image_id=None):
         try:
             image = ProductImage.objects.get(id=image_id, product_id=pk)
-            image.delete()
+            with transaction.atomic():
+                image.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         except ProductImage.DoesNotExist:
             return Response(
@@ -48,9 +303,62 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(FastListMixin, SparseFieldsetMixin, TimedSerializationMixin, viewsets.ModelViewSet):
+    queryset = OrderSerializer.setup_eager_loading(Order.objects.order_by('id'))
     serializer_class = OrderSerializer
+    fast_list_serializer = OrderSerializer
+
+    bulk_chunk_size = 500
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        records = request.data
+        # A JSON array, or the lazily parsed lines of an NDJSON body
+        if not isinstance(records, (list, GeneratorType)):
+            raise ParseError("Expected a JSON array or newline-delimited JSON of orders")
+
+        records = iter(records)
+        results = []
+        index = 0
+        while True:
+            chunk = list(islice(records, self.bulk_chunk_size))
+            if not chunk:
+                break
+
+            context = self.get_serializer_context()
+            context['related_objects'] = OrderSerializer.prefetch_related_objects(chunk)
+            valid = []
+            for record in chunk:
+                result = {'index': index}
+                index += 1
+                results.append(result)
+                if not isinstance(record, dict):
+                    result.update(status='invalid', errors={"detail": "Expected a JSON object"})
+                    continue
+                serializer = OrderSerializer(data=record, context=context)
+                if serializer.is_valid():
+                    valid.append((result, serializer.validated_data))
+                else:
+                    result.update(status='invalid', errors=serializer.errors)
+
+            serializer = OrderSerializer(many=True, context=context)
+            orders = iter(serializer.create([data for _, data in valid]))
+            for position, (result, _) in enumerate(valid):
+                if position in serializer.conflicts:
+                    result.update(
+                        status='conflict',
+                        errors={"detail": "Insufficient stock", "items": serializer.conflicts[position]}
+                    )
+                else:
+                    result.update(status='created', id=next(orders).id)
+
+        counts = Counter(result['status'] for result in results)
+        return Response({
+            'created': counts['created'],
+            'invalid': counts['invalid'],
+            'conflict': counts['conflict'],
+            'results': results
+        })
 
     @action(detail=True, methods=['patch'], url_path='status')
     def update_status(self, request, pk=None):
@@ -63,158 +371,150 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        order.status = status_value
-        order.save()
+        with transaction.atomic():
+            before = snapshot_order(order)
+            order.status = status_value
+            order.save()
+            order_written(order, before)
 
         serializer = self.get_serializer(order)
         return Response(serializer.data)
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
-    queryset = Customer.objects.all()
+class CustomerViewSet(SparseFieldsetMixin, TimedSerializationMixin, viewsets.ModelViewSet):
+    queryset = CustomerSerializer.setup_eager_loading(Customer.objects.order_by('id'))
     serializer_class = CustomerSerializer
 
     @action(detail=True, methods=['get'])
     def orders(self, request, pk=None):
         customer = self.get_object()
-        orders = customer.orders.all()
+        orders = OrderSerializer.setup_eager_loading(customer.orders.all())
         serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        with timed_serialization():
+            data = serializer.data
+        return Response(data)
 
 
 class DashboardStatsView(generics.GenericAPIView):
-    def get(self, request):
-        # Basic stats
-        total_products = Product.objects.count()
-        total_orders = Order.objects.count()
-        total_customers = Customer.objects.count()
-        total_revenue = OrderItem.objects.aggregate(
-            total=Sum('price')
-        )['total'] or 0
-
-        # Top products
-        top_products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity')
-        ).filter(total_sold__gt=0).order_by('-total_sold')[:3]
-
-        top_products_data = [
-            {
-                'id': product.id,
-                'name': product.name,
-                'total_sold': product.total_sold,
-                'revenue': str(product.price * product.total_sold)
-            }
-            for product in top_products
-        ]
-
-        # Recent orders
-        recent_orders = Order.objects.all().order_by('-created_at')[:5]
-        recent_orders_serializer = OrderSerializer(recent_orders, many=True)
+    replica_reads = True
 
+    @versioned_cache
+    def get(self, request):
         return Response({
-            'total_products': total_products,
-            'total_orders': total_orders,
-            'total_customers': total_customers,
-            'total_revenue': str(total_revenue),
-            'top_products': top_products_data,
-            'recent_orders': recent_orders_serializer.data
+            'total_products': Product.objects.count(),
+            'total_orders': total_orders(),
+            'total_customers': Customer.objects.count(),
+            'total_revenue': str(total_revenue()),
+            'top_products': top_selling_products(3),
+            'recent_orders': recent_orders()
         })
 
 
 class TopProductsView(generics.GenericAPIView):
-    def get(self, request):
-        top_products = Product.objects.annotate(
-            total_sold=Sum('orderitem__quantity')
-        ).filter(total_sold__gt=0).order_by('-total_sold')[:10]
-
-        top_products_data = [
-            {
-                'id': product.id,
-                'name': product.name,
-                'total_sold': product.total_sold,
-                'revenue': str(product.price * product.total_sold)
-            }
-            for product in top_products
-        ]
+    replica_reads = True
 
-        return Response(top_products_data)
+    @versioned_cache
+    def get(self, request):
+        return Response(top_selling_products(10))
 
 
 class TopCustomersView(generics.GenericAPIView):
+    replica_reads = True
+
+    @versioned_cache
     def get(self, request):
-        top_customers = Customer.objects.annotate(
-            order_count=Count('orders'),
-            total_spent=Sum('orders__total_price')
-        ).filter(order_count__gt=0).order_by('-total_spent')[:10]
-
-        top_customers_data = [
-            {
-                'id': customer.id,
-                'username': customer.user.username,
-                'order_count': customer.order_count,
-                'total_spent': str(customer.total_spent)
-            }
-            for customer in top_customers
-        ]
+        return Response(top_customers())
 
-        return Response(top_customers_data)
+
+class DashboardCacheStatsView(generics.GenericAPIView):
+    def get(self, request):
+        return Response(get_stats())
 
 
 class RevenueStatsView(generics.GenericAPIView):
+    replica_reads = True
+    cache_per_day = True
+
+    @versioned_cache
     def get(self, request):
-        today = timezone.now().date()
-
-        # Daily revenue (last 7 days)
-        daily_revenue = []
-        for i in range(7):
-            day = today - timedelta(days=i)
-            day_revenue = Order.objects.filter(
-                created_at__date=day
-            ).aggregate(total=Sum('total_price'))['total'] or 0
-
-            daily_revenue.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'revenue': str(day_revenue)
-            })
-
-        # Weekly revenue (last 4 weeks)
-        weekly_revenue = []
-        for i in range(4):
-            week_start = today - timedelta(days=today.weekday() + 7 * i)
-            week_end = week_start + timedelta(days=6)
-
-            week_revenue = Order.objects.filter(
-                created_at__date__gte=week_start,
-                created_at__date__lte=week_end
-            ).aggregate(total=Sum('total_price'))['total'] or 0
-
-            weekly_revenue.append({
-                'week': f"{week_start.strftime('%Y-%m-%d')} to {week_end.strftime('%Y-%m-%d')}",
-                'revenue': str(week_revenue)
-            })
-
-        # Monthly revenue (last 6 months)
-        monthly_revenue = []
-        for i in range(6):
-            month = today.month - i
-            year = today.year
-
-            if month <= 0:
-                month += 12
-                year -= 1
-
-            month_revenue = Order.objects.filter(
-                created_at__year=year,
-                created_at__month=month
-            ).aggregate(total=Sum('total_price'))['total'] or 0
-
-            monthly_revenue.append({
-                'month': f"{year}-{month:02d}",
-                'revenue': str(month_revenue)
-            })
+        return Response(revenue_report(request.query_params))
 
-        return Response({
-            'daily': daily_revenue,
-            'weekly': weekly_revenue,
-            'monthly': monthly_revenue
-        })
+
+class BaseExportView(generics.GenericAPIView):
+    """
+    Streams the whole filtered queryset as CSV (default) or NDJSON
+    (``?output=ndjson``), reading it in chunks so memory use stays flat.
+    ``?from=``/``?to=`` (YYYY-MM-DD, inclusive) filter on ``created_at``.
+    """
+    export_name = None
+    csv_header = None
+    csv_rows = None
+    record = None
+
+    def filter_export(self, queryset, params):
+        return queryset
+
+    def get(self, request):
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            raise ParseError("Invalid output, expected 'csv' or 'ndjson'")
+
+        date_from = parse_date_param(params, 'from')
+        date_to = parse_date_param(params, 'to')
+        if date_from is False or date_to is False:
+            raise ParseError("Invalid date, expected YYYY-MM-DD")
+
+        queryset = self.filter_export(self.get_queryset(), params)
+        if date_from:
+            queryset = queryset.filter(created_at__gte=day_start(date_from))
+        if date_to:
+            queryset = queryset.filter(created_at__lt=day_start(date_to + timedelta(days=1)))
+        rows = queryset.order_by('id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+        if output == 'csv':
+            response = StreamingHttpResponse(csv_stream(self.csv_header, self.csv_rows(rows)), content_type='text/csv')
+        else:
+            records = (self.record(row) for row in rows)
+            response = StreamingHttpResponse(ndjson_stream(records), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{self.export_name}.{output}"'
+        return response
+
+
+class OrderExportView(BaseExportView):
+    queryset = OrderSerializer.setup_eager_loading(Order.objects.all())
+    export_name = 'orders'
+    csv_header = ORDER_CSV_HEADER
+    csv_rows = staticmethod(order_csv_rows)
+    record = staticmethod(order_record)
+
+    def filter_export(self, queryset, params):
+        if 'status' not in params:
+            return queryset
+        statuses = params['status'].split(',')
+        if not set(statuses) <= set(dict(Order.STATUS_CHOICES)):
+            raise ParseError("Invalid status value")
+        return queryset.filter(status__in=statuses)
+
+
+class ProductExportView(BaseExportView):
+    queryset = Product.objects.select_related('category')
+    export_name = 'products'
+    csv_header = PRODUCT_CSV_HEADER
+    csv_rows = staticmethod(product_csv_rows)
+    record = staticmethod(product_record)
+
+    def filter_export(self, queryset, params):
+        if 'is_active' not in params:
+            return queryset
+        if params['is_active'] not in ('true', 'false'):
+            raise ParseError("Invalid is_active value, expected 'true' or 'false'")
+        return queryset.filter(is_active=params['is_active'] == 'true')
+
+
+class CustomerExportView(BaseExportView):
+    queryset = CustomerSerializer.setup_eager_loading(Customer.objects.all())
+    export_name = 'customers'
+    csv_header = CUSTOMER_CSV_HEADER
+    csv_rows = staticmethod(customer_csv_rows)
+    record = staticmethod(customer_record)
@@ -2,6 +2,7 @@
 ASGI config for ecommerce_dashboard project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Uses the ASGI profile in ``ecommerce_dashboard.settings_asgi`` by default.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +12,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_dashboard.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_dashboard.settings_asgi')
 
 application = get_asgi_application()
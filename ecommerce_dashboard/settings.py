@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +77,106 @@ WSGI_APPLICATION = 'ecommerce_dashboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+SQLITE_OPTIONS = {
+    # Take the write lock when the transaction starts so concurrent
+    # checkouts wait on each other instead of failing to upgrade
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        # Reuse connections across requests, checking them before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            # File-backed so that the concurrency tests can use several connections
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Read-only copy of the primary, refreshed by `manage.py sync_sqlite_replica`.
+    # Point this at a streaming replica when running on a server database.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# Read replicas
+# The dashboard views and the list/retrieve endpoints read from one of
+# DATABASE_REPLICAS (picked at random per request); everything else,
+# including all writes, uses the primary. A client that writes is pinned
+# to the primary for READ_YOUR_WRITES_WINDOW seconds, which should cover
+# the replication lag. Set SQLITE_REPLICA=1 to read from the local copy.
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+DATABASE_REPLICAS = ['replica'] if os.environ.get('SQLITE_REPLICA') else []
+READ_YOUR_WRITES_WINDOW = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache is per process; use a shared backend such as
+# 'django.core.cache.backends.filebased.FileBasedCache' (with a LOCATION
+# directory) or Redis when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+    },
 }
 
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+DASHBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+DASHBOARD_CACHE_LOCK_TIMEOUT = 30
+
+# Serve the dashboard from the async views in api.async_views, which run
+# their independent queries concurrently. Only worth it under ASGI, see
+# ecommerce_dashboard.settings_asgi.
+DASHBOARD_ASYNC_VIEWS = False
+
+
+# Analytics snapshot
+# Built by `manage.py build_analytics_snapshot` (pass --interval to keep it
+# refreshed). Dashboard views answer from it while it is at most
+# ANALYTICS_SNAPSHOT_MAX_AGE seconds old and no write happened after it was
+# built; until the next refresh they query the rollup instead. Set the path
+# to None to always query the database.
+
+ANALYTICS_SNAPSHOT_PATH = BASE_DIR / 'analytics.snapshot'
+ANALYTICS_SNAPSHOT_MAX_AGE = 5 * 60
+
+
+# Instrumentation
+# Per-request query count, SQL time, duplicate queries and serializer time,
+# reported in Server-Timing headers and aggregated at /api/_metrics/.
+# Queries taking at least SLOW_QUERY_THRESHOLD_MS are logged to the
+# 'api.slow_queries' logger with the project frames that issued them;
+# None disables the slow-query log.
+
+INSTRUMENTATION_ENABLED = True
+SLOW_QUERY_THRESHOLD_MS = None
+
+
+# Product search
+# SQLiteFTSBackend needs the FTS5 table created by the api migrations;
+# DatabaseSearchBackend works on any database without an index.
+
+PRODUCT_SEARCH_BACKEND = 'api.search.SQLiteFTSBackend'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +219,12 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded product and category images get thumbnail, list and detail
+# renditions (WebP and JPEG), created after the upload by this many worker
+# threads per process; 0 creates them when the upload commits.
+# `manage.py create_image_renditions` processes images that were missed.
+IMAGE_RENDITION_WORKERS = 2
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -130,6 +232,15 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.StandardPagination',
     'PAGE_SIZE': 10,
-}
\ No newline at end of file
+}
+
+# Serve product and order lists from values() rows through precompiled
+# serializer plans (api.fast_serialization) instead of the serializers.
+FAST_LIST_SERIALIZATION = True
+
+# Cache-Control of product and category reads, which carry an ETag and
+# Last-Modified. Browsers revalidate on every use; shared caches such as a
+# CDN may serve a response for s-maxage seconds before revalidating it.
+CATALOG_CACHE_CONTROL = 'public, max-age=0, s-maxage=60, stale-while-revalidate=30'
@@ -0,0 +1,17 @@
+"""
+Settings for serving the project over ASGI, e.g.
+
+    uvicorn ecommerce_dashboard.asgi:application --workers 4
+
+The dashboard endpoints switch to their async versions. Those run their
+queries in worker threads, each with its own connection, so connections are
+not kept open between requests.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DASHBOARD_ASYNC_VIEWS = True
+
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = 0